@@ -1,7 +1,8 @@
 from django.contrib import admin
 
-from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
-                     ShoppingCart, Tag)
+from .carts import rebuild_recipe_carts
+from .models import (ExportJob, Favorite, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCart, Tag)
 
 
 class RecipeTagInline(admin.TabularInline):
@@ -31,12 +32,18 @@ class RecipeAdmin(admin.ModelAdmin):
     list_filter = ('author', 'name', 'tags')
     empty_value_display = '-пусто-'
 
+    def save_related(self, request, form, formsets, change):
+        '''Recalculate shopping carts after change of ingredients.'''
+        super().save_related(request, form, formsets, change)
+        if change:
+            rebuild_recipe_carts(form.instance.pk)
+
     def get_tags(self, obj):
         '''Return tags of the Recipe names.'''
         return list(obj.tags.values_list('name', flat=True))
 
     def favorited(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 class IngredientAdmin(admin.ModelAdmin):
@@ -83,6 +90,28 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     '''AdminModel for standart Django panel for RecipeTag M2M model.'''
     list_display = ('id', 'ingredient', 'recipe', 'amount')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        old_recipe = form.initial.get('recipe')
+        rebuild_recipe_carts(
+            obj.recipe_id, *([old_recipe] if old_recipe else [])
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_recipe_carts(obj.recipe_id)
+
+    def delete_queryset(self, request, queryset):
+        recipe_ids = set(queryset.values_list('recipe_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_recipe_carts(*recipe_ids)
+
+
+class ExportJobAdmin(admin.ModelAdmin):
+    '''AdminModel for standart Django panel for shopping list exports.'''
+    list_display = ('id', 'user', 'file_format', 'status', 'created')
+    list_filter = ('status', 'file_format')
+
 
 admin.site.register(Favorite, FaworiteAdmin)
 admin.site.register(ShoppingCart, ShoppingCartAdmin)
@@ -90,3 +119,4 @@ admin.site.register(Ingredient, IngredientAdmin)
 admin.site.register(Tag, TagAdmin)
 admin.site.register(Recipe, RecipeAdmin)
 admin.site.register(RecipeIngredient, RecipeIngredientAdmin)
+admin.site.register(ExportJob, ExportJobAdmin)
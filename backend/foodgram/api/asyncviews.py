@@ -0,0 +1,66 @@
+'''Async serving of read-only API routes under ASGI.
+
+Django 3.2 has no async ORM and DRF views are synchronous, so the async
+views below run the DRF view in a thread pool of ASYNC_READ_WORKERS
+threads per process (each thread has its own database connection) while
+the event loop keeps serving other requests. Without them Django runs every
+sync view of a request in one thread (thread_sensitive), and slow database
+calls pin it. Only GET/HEAD/OPTIONS requests go to the pool, writes are
+run by Django as usual. Routes are wrapped by api.urls when
+ASYNC_READ_VIEWS is set (foodgram/asgi.py sets it).
+'''
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    '''Return process-wide pool of read threads, create it on first use.'''
+    return ThreadPoolExecutor(
+        max_workers=settings.ASYNC_READ_WORKERS,
+        thread_name_prefix='async-read',
+    )
+
+
+def run_view(view, request, *args, **kwargs):
+    '''Run view and render its response in a pool thread.
+
+    Connections of pool threads are not closed by request_finished (it is
+    sent in another thread), so they are closed or reused here following
+    CONN_MAX_AGE.
+    '''
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    '''Return async view running view for read requests in thread pool.'''
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        if request.method in READ_METHODS:
+            return await sync_to_async(
+                run_view, thread_sensitive=False, executor=get_executor()
+            )(view, request, *args, **kwargs)
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    return async_view
+
+
+def make_async_patterns(patterns, names):
+    '''Wrap views of url patterns with the names by async_read_view.'''
+    for pattern in patterns:
+        if getattr(pattern, 'name', None) in names:
+            pattern.callback = async_read_view(pattern.callback)
+    return patterns
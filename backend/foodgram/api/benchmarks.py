@@ -0,0 +1,518 @@
+'''Seeding and measuring helpers for the "benchmark" management command.
+
+Seeds realistic volumes of users, recipes, favorites, shopping carts and
+subscriptions and measures latency, SQL query count and rows fetched for
+every API route. Tag filter strategies are compared on querysets.
+'''
+import csv
+import json
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .caches import invalidate
+from .carts import rebuild_cart_totals
+from .counters import recount_counters
+from .filters import filter_by_tags
+from .models import (ExportJob, Favorite, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCart, Tag)
+from .search import ingredient_index
+from foodgram.settings import BASE_DIR
+from users.authentication import local_cache
+from users.models import Subscription, User
+
+BATCH_SIZE = 5000
+BENCHMARK_PASSWORD = 'benchmark-password-1q2w3e'
+BENCHMARK_IMAGE = 'media/recipes/images/benchmark.png'
+DEFAULT_INGREDIENTS_FILE = os.path.join(
+    BASE_DIR.parent.parent, 'data', 'ingredients.csv'
+)
+# Test databases reuse ids of the working one: their entries must not get
+# into the shared cache of the running servers.
+ISOLATED_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+
+
+def clear_caches():
+    '''Clear the cache and in-process caches (cold request).'''
+    cache.clear()
+    local_cache.clear()
+    ingredient_index.reset()
+
+
+def percentile(values, percent):
+    '''Return percentile of values (nearest-rank method).'''
+    ordered = sorted(values)
+    if not ordered:
+        return 0
+    rank = max(int(round(percent / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def read_ingredients(path):
+    '''Yield (name, measurement_unit) pairs from CSV or JSON catalog.'''
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if path.endswith('.json'):
+            for ingredient in json.load(file):
+                yield ingredient['name'], ingredient['measurement_unit']
+            return
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+
+@contextmanager
+def explicit_pub_date():
+    '''Allow to set Recipe.pub_date explicitly while seeding.'''
+    field = Recipe._meta.get_field('pub_date')
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def bulk_create(model, objects):
+    '''Create objects by batches, return number of created objects.'''
+    model.objects.bulk_create(
+        objects, batch_size=BATCH_SIZE, ignore_conflicts=True
+    )
+    return len(objects)
+
+
+def seed_database(users=10000, recipes=50000, tags=10, favorites=30,
+                  carts=10, subscriptions=20, ingredients_file=None,
+                  seed=0, stdout=None):
+    '''Fill the database with benchmark data, return created volumes.
+
+    favorites, carts and subscriptions are the numbers of rows per user.
+    '''
+    rnd = random.Random(seed)
+    log = stdout.write if stdout else (lambda message: None)
+    volumes = {}
+
+    log('Seeding ingredients...')
+    volumes['ingredients'] = bulk_create(Ingredient, [
+        Ingredient(name=name, measurement_unit=unit)
+        for name, unit in dict(read_ingredients(
+            ingredients_file or DEFAULT_INGREDIENTS_FILE
+        )).items()
+    ])
+    ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+
+    log('Seeding tags...')
+    volumes['tags'] = bulk_create(Tag, [
+        Tag(name=f'tag-{i}', color=f'#{i:06X}', slug=f'tag-{i}')
+        for i in range(tags)
+    ])
+    tag_ids = list(Tag.objects.values_list('id', flat=True))
+
+    log('Seeding users...')
+    # Hashing is slow, all benchmark users share the same password.
+    password = make_password(BENCHMARK_PASSWORD)
+    volumes['users'] = bulk_create(User, [
+        User(
+            username=f'bench{i}',
+            email=f'bench{i}@bench.ru',
+            first_name=f'Bench{i}',
+            last_name='Benchmark',
+            password=password,
+        ) for i in range(users)
+    ])
+    user_ids = list(User.objects.values_list('id', flat=True))
+
+    log('Seeding recipes...')
+    now = timezone.now()
+    with explicit_pub_date():
+        for start in range(0, recipes, BATCH_SIZE):
+            bulk_create(Recipe, [
+                Recipe(
+                    author_id=rnd.choice(user_ids),
+                    name=f'Recipe {i}',
+                    text=f'Benchmark recipe {i}. ' * 20,
+                    image=BENCHMARK_IMAGE,
+                    cooking_time=rnd.randint(1, 180),
+                    pub_date=now - timedelta(minutes=i),
+                ) for i in range(start, min(start + BATCH_SIZE, recipes))
+            ])
+    volumes['recipes'] = recipes
+    recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+
+    log('Seeding recipe ingredients and tags...')
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        batch = recipe_ids[start:start + BATCH_SIZE]
+        bulk_create(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rnd.randint(1, 500)
+            )
+            for recipe_id in batch
+            for ingredient_id in rnd.sample(
+                ingredient_ids, min(rnd.randint(3, 10), len(ingredient_ids))
+            )
+        ])
+        bulk_create(RecipeTag, [
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in batch
+            for tag_id in rnd.sample(
+                tag_ids, min(rnd.randint(1, 3), len(tag_ids))
+            )
+        ])
+
+    log('Seeding favorites, shopping carts and subscriptions...')
+    for name, model, per_user, field, targets in (
+        ('favorites', Favorite, favorites, 'recipe_id', recipe_ids),
+        ('carts', ShoppingCart, carts, 'recipe_id', recipe_ids),
+        ('subscriptions', Subscription, subscriptions, 'following_id',
+         user_ids),
+    ):
+        volumes[name] = 0
+        for start in range(0, len(user_ids), BATCH_SIZE // max(per_user, 1)):
+            objects = [
+                model(user_id=user_id, **{field: target})
+                for user_id in user_ids[
+                    start:start + BATCH_SIZE // max(per_user, 1)
+                ]
+                for target in rnd.sample(targets, min(per_user, len(targets)))
+                if target != user_id or model is not Subscription
+            ]
+            volumes[name] += bulk_create(model, objects)
+    recount_counters()
+    rebuild_cart_totals()
+    invalidate('tags', 'ingredients')
+    return volumes
+
+
+class RouteBenchmark:
+    '''Measures latency, number of queries and fetched rows of API routes.'''
+
+    def __init__(self, user, iterations=20, warmup=2):
+        self.user = user
+        self.iterations = iterations
+        self.warmup = warmup
+        self.token, _ = Token.objects.get_or_create(user=user)
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def request(self, client, method, path, data=None):
+        return getattr(client, method)(path, data=data, format='json')
+
+    def measure(self, name, method, path, data=None, anonymous=False,
+                client=None, before=None, after=None):
+        '''Measure the route, return result dict.
+
+        path and data may be callables evaluated before each iteration.
+        before and after are callables preparing and cleaning up state of
+        the database between iterations (e.g. deleting created favorite).
+        The first (not timed) iteration runs with cleared caches: queries
+        are the most of warm iterations, queries_cold of the cold one.
+        '''
+        if client is None:
+            client = self.anonymous if anonymous else self.client
+        timings = []
+        queries = []
+        for iteration in range(-1, self.warmup + self.iterations):
+            if iteration < 0:
+                clear_caches()
+            if before:
+                before()
+            url = path() if callable(path) else path
+            payload = data() if callable(data) else data
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = self.request(client, method, url, payload)
+                elapsed = time.perf_counter() - started
+            # Next request resets the queries log, so copy it right away.
+            captured = list(context.captured_queries)
+            if after:
+                after(response)
+            if iteration < 0:
+                queries_cold = len(captured)
+            elif iteration >= self.warmup:
+                timings.append(elapsed * 1000)
+                queries.append(len(captured))
+        return {
+            'name': name,
+            'method': method.upper(),
+            'path': url,
+            'anonymous': anonymous,
+            'status': response.status_code,
+            'iterations': self.iterations,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': max(queries),
+            'queries_cold': queries_cold,
+            'rows': self.count_rows(captured),
+        }
+
+    def measure_queryset(self, name, build, page_size=6):
+        '''Measure count and first page of queryset returned by build().
+
+        The same work the page number pagination of a list does.
+        '''
+        timings = []
+        for iteration in range(self.warmup + self.iterations):
+            queryset = build()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                queryset.count()
+                list(queryset[:page_size])
+                elapsed = time.perf_counter() - started
+            if iteration >= self.warmup:
+                timings.append(elapsed * 1000)
+        return {
+            'name': name,
+            'iterations': self.iterations,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'mean_ms': round(sum(timings) / len(timings), 3),
+            'queries': len(context.captured_queries),
+        }
+
+    def tag_sweep(self, max_tags=10):
+        '''Compare JOIN + DISTINCT and EXISTS tag filters for 1..max_tags.'''
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:max_tags])
+        results = []
+        for number in range(1, len(slugs) + 1):
+            selected = slugs[:number]
+            for strategy, build in (
+                ('distinct', lambda: Recipe.objects.filter(
+                    tags__slug__in=selected
+                ).distinct()),
+                ('exists', lambda: filter_by_tags(
+                    Recipe.objects.all(), selected
+                )),
+            ):
+                result = self.measure_queryset(
+                    f'recipes-tags-{strategy}', build
+                )
+                result.update(strategy=strategy, tags=number)
+                results.append(result)
+        return results
+
+    def new_user_data(self, number):
+        return {
+            'username': f'bench-new{number}',
+            'email': f'bench-new{number}@bench.ru',
+            'first_name': 'Bench',
+            'last_name': 'Benchmark',
+            'password': BENCHMARK_PASSWORD,
+        }
+
+    def wait_for_job(self, job_id, timeout=60):
+        '''Wait until the export job is finished, return its id.'''
+        deadline = time.monotonic() + timeout
+        while ExportJob.objects.filter(
+            pk=job_id, status__in=(ExportJob.PENDING, ExportJob.RUNNING)
+        ).exists():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Export job {job_id} is not finished.')
+            time.sleep(0.01)
+        return job_id
+
+    def count_rows(self, captured_queries):
+        '''Return number of rows fetched by captured SELECT queries.'''
+        rows = 0
+        with connection.cursor() as cursor:
+            for query in captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith('SELECT'):
+                    continue
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM ({sql}) AS benchmark_rows'
+                )
+                rows += cursor.fetchone()[0]
+        return rows
+
+    def run(self):
+        '''Measure every route of api/urls.py, return list of results.'''
+        recipe = Recipe.objects.filter(author=self.user).first()
+        if recipe is None:
+            recipe = Recipe.objects.first()
+        other = Recipe.objects.exclude(
+            favorites__user=self.user
+        ).exclude(in_shopping_cart__user=self.user).first()
+        author = User.objects.exclude(
+            id=self.user.id
+        ).exclude(following__user=self.user).first()
+        ingredient = Ingredient.objects.first()
+        tag = Tag.objects.first()
+        # Several tags and ingredients: a query per item shows up as N+1.
+        recipe_data = {
+            'name': 'Benchmark recipe',
+            'text': 'Benchmark recipe text.',
+            'cooking_time': 10,
+            'tags': list(Tag.objects.values_list('id', flat=True)[:3]),
+            'ingredients': [
+                {'id': pk, 'amount': 10}
+                for pk in Ingredient.objects.values_list('id', flat=True)[:5]
+            ],
+        }
+        created = []
+        results = []
+        measure = results.append
+
+        measure(self.measure('api-root', 'get', '/api/', anonymous=True))
+        for anonymous in (True, False):
+            measure(self.measure(
+                'recipes-list', 'get', '/api/recipes/', anonymous=anonymous
+            ))
+            measure(self.measure(
+                'recipes-list-tags', 'get',
+                f'/api/recipes/?tags={tag.slug}', anonymous=anonymous
+            ))
+            measure(self.measure(
+                'recipes-detail', 'get', f'/api/recipes/{recipe.id}/',
+                anonymous=anonymous
+            ))
+            measure(self.measure(
+                'tags-list', 'get', '/api/tags/', anonymous=anonymous
+            ))
+            measure(self.measure(
+                'tags-detail', 'get', f'/api/tags/{tag.id}/',
+                anonymous=anonymous
+            ))
+            measure(self.measure(
+                'ingredients-list', 'get', '/api/ingredients/',
+                anonymous=anonymous
+            ))
+            measure(self.measure(
+                'ingredients-search', 'get',
+                f'/api/ingredients/?name={ingredient.name[:2]}',
+                anonymous=anonymous
+            ))
+            measure(self.measure(
+                'ingredients-detail', 'get',
+                f'/api/ingredients/{ingredient.id}/', anonymous=anonymous
+            ))
+        measure(self.measure(
+            'recipes-list-favorited', 'get', '/api/recipes/?is_favorited=1'
+        ))
+        measure(self.measure(
+            'recipes-list-shopping-cart', 'get',
+            '/api/recipes/?is_in_shopping_cart=1'
+        ))
+        measure(self.measure(
+            'recipes-list-author', 'get',
+            f'/api/recipes/?author={recipe.author_id}'
+        ))
+        measure(self.measure('users-list', 'get', '/api/users/'))
+        measure(self.measure(
+            'users-detail', 'get', f'/api/users/{author.id}/'
+        ))
+        measure(self.measure('users-me', 'get', '/api/users/me/'))
+        measure(self.measure(
+            'users-subscriptions', 'get', '/api/users/subscriptions/'
+        ))
+        measure(self.measure(
+            'download-shopping-cart', 'get',
+            '/api/recipes/download_shopping_cart/'
+        ))
+        measure(self.measure(
+            'shopping-cart-totals', 'get', '/api/recipes/shopping_cart_totals/'
+        ))
+        # Jobs are rendered by the worker pool, not timed or counted.
+        jobs = []
+        measure(self.measure(
+            'shopping-cart-job', 'post',
+            '/api/recipes/download_shopping_cart/?type=txt',
+            after=lambda response: jobs.append(
+                self.wait_for_job(response.data['id'])
+            )
+        ))
+        measure(self.measure(
+            'shopping-cart-export', 'get',
+            f'/api/recipes/download_shopping_cart/{jobs[-1]}/',
+            after=lambda response: response.close()
+        ))
+        for path, name in (
+            (f'/api/recipes/{other.id}/favorite/', 'recipe-favorite'),
+            (f'/api/recipes/{other.id}/shopping_cart/', 'shopping-cart'),
+            (f'/api/users/{author.id}/subscribe/', 'subscribe'),
+        ):
+            measure(self.measure(
+                name, 'post', path,
+                after=lambda response: self.request(
+                    self.client, 'delete', path
+                )
+            ))
+            measure(self.measure(
+                name, 'delete', path,
+                before=lambda: self.request(self.client, 'post', path)
+            ))
+        measure(self.measure(
+            'recipes-create', 'post', '/api/recipes/', data=recipe_data,
+            after=lambda response: created.append(response.data['id'])
+        ))
+        measure(self.measure(
+            'recipes-update', 'patch', f'/api/recipes/{created[-1]}/',
+            data=recipe_data
+        ))
+        measure(self.measure(
+            'recipes-delete', 'delete',
+            lambda: f'/api/recipes/{created.pop()}/',
+            before=lambda: created or created.append(
+                self.request(
+                    self.client, 'post', '/api/recipes/', recipe_data
+                ).data['id']
+            )
+        ))
+        # Metrics are available to staff only.
+        staff, _ = User.objects.get_or_create(
+            username='bench-staff',
+            defaults={'email': 'bench-staff@bench.ru', 'is_staff': True}
+        )
+        staff_client = APIClient()
+        staff_client.credentials(HTTP_AUTHORIZATION='Token {}'.format(
+            Token.objects.get_or_create(user=staff)[0].key
+        ))
+        measure(self.measure(
+            'database-pool-stats', 'get', '/api/metrics/db_pool/',
+            client=staff_client
+        ))
+        counter = iter(range(10 ** 9))
+        measure(self.measure(
+            'users-create', 'post', '/api/users/', anonymous=True,
+            data=lambda: self.new_user_data(next(counter))
+        ))
+        measure(self.measure(
+            'set-password', 'post', '/api/users/set_password/', data={
+                'current_password': BENCHMARK_PASSWORD,
+                'new_password': BENCHMARK_PASSWORD,
+            }
+        ))
+        credentials = {
+            'email': self.user.email, 'password': BENCHMARK_PASSWORD
+        }
+        measure(self.measure(
+            'token-login', 'post', '/api/auth/token/login/',
+            data=credentials, anonymous=True
+        ))
+        # Logout deletes the token, so it is measured with its own client.
+        logout_client = APIClient()
+        measure(self.measure(
+            'token-logout', 'post', '/api/auth/token/logout/',
+            client=logout_client, before=lambda: logout_client.credentials(
+                HTTP_AUTHORIZATION='Token {}'.format(
+                    Token.objects.get_or_create(user=self.user)[0].key
+                )
+            )
+        ))
+        return results
@@ -0,0 +1,76 @@
+'''Versioned cache helpers.
+
+Every namespace (e.g. "tags" or "ingredients") has a version stored in the
+cache. Cached entries and ETags include the version, so invalidation of
+a namespace is a single increment of its version and old entries just
+expire.
+'''
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'version:{namespace}'
+
+
+def get_version(namespace):
+    '''Return current version of the namespace.'''
+    key = VERSION_KEY.format(namespace=namespace)
+    version = cache.get(key)
+    if version is not None:
+        return version
+    # Start from timestamp: if the version is lost (cache restart or
+    # eviction) it does not match versions already known by clients.
+    cache.add(key, int(time.time() * 1000), None)
+    return cache.get(key)
+
+
+def invalidate(*namespaces):
+    '''Increment versions of the namespaces, invalidating their entries.'''
+    for namespace in namespaces:
+        key = VERSION_KEY.format(namespace=namespace)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
+
+
+def on_commit_once(key, func):
+    '''Run func when the current transaction is committed, once per key.
+
+    Signals of every saved or deleted row of a transaction schedule the
+    same work; it is done once. Callbacks of rolled back savepoints are
+    dropped by Django, so the work is scheduled again after them.
+    '''
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        getattr(callback, 'once_key', None) == key
+        for _, callback in connection.run_on_commit
+    ):
+        return
+
+    def callback():
+        func()
+
+    callback.once_key = key
+    transaction.on_commit(callback)
+
+
+def invalidate_on_commit(*namespaces):
+    '''Invalidate namespaces when the current transaction is committed.
+
+    Otherwise a concurrent request may cache not yet committed (old) data
+    under the new version.
+    '''
+    on_commit_once(
+        ('invalidate',) + namespaces, lambda: invalidate(*namespaces)
+    )
+
+
+def make_key(namespace, version, *parts):
+    '''Return cache key (or ETag value) for the namespace version.'''
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in parts).encode('utf-8')
+    ).hexdigest()
+    return f'{namespace}:{version}:{digest}'
@@ -0,0 +1,109 @@
+'''Materialized shopping cart totals (ShoppingCartIngredient).
+
+Total amount of every ingredient of recipes in user's shopping cart is
+stored, so the shopping list is read without aggregation over carts,
+recipes and their ingredients. Totals are changed incrementally when a
+recipe enters or leaves the cart (api.signals) and when ingredients of a
+recipe in carts are changed (RecipeSerializer.update, RecipeAdmin). Bulk
+operations bypass signals, so after them totals are rebuilt from scratch.
+'''
+from collections import Counter
+
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingCartIngredient
+
+BATCH_SIZE = 1000
+
+
+def get_recipe_amounts(recipe_id):
+    '''Return dict ingredient id - amount of ingredients of the recipe.'''
+    return dict(RecipeIngredient.objects.filter(
+        recipe_id=recipe_id, ingredient__isnull=False
+    ).values_list('ingredient_id', 'amount'))
+
+
+def get_amounts_delta(old_amounts, new_amounts):
+    '''Return dict ingredient id - change of amount, zero changes dropped.'''
+    delta = Counter(new_amounts)
+    delta.subtract(old_amounts)
+    return {pk: amount for pk, amount in delta.items() if amount}
+
+
+def change_cart_totals(user_ids, amounts):
+    '''Add amounts (dict ingredient id - delta) to carts of users.
+
+    Missing totals are inserted as zeros, then all totals are changed by one
+    UPDATE and totals dropped to zero are deleted.
+    '''
+    user_ids = list(user_ids)
+    amounts = {pk: amount for pk, amount in amounts.items() if amount}
+    if not user_ids or not amounts:
+        return
+    ShoppingCartIngredient.objects.bulk_create(
+        [
+            ShoppingCartIngredient(user_id=user_id, ingredient_id=pk)
+            for user_id in user_ids
+            for pk, amount in amounts.items() if amount > 0
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    totals = ShoppingCartIngredient.objects.filter(
+        user_id__in=user_ids, ingredient_id__in=amounts
+    )
+    totals.update(amount=Greatest(F('amount') + Case(
+        *[
+            When(ingredient_id=pk, then=Value(amount))
+            for pk, amount in amounts.items()
+        ],
+        default=Value(0),
+        output_field=IntegerField(),
+    ), 0))
+    totals.filter(amount=0).delete()
+
+
+def change_recipe_in_carts(recipe_id, old_amounts, new_amounts):
+    '''Apply change of ingredients of the recipe to carts containing it.'''
+    delta = get_amounts_delta(old_amounts, new_amounts)
+    if delta:
+        change_cart_totals(
+            ShoppingCart.objects.filter(
+                recipe_id=recipe_id
+            ).values_list('user_id', flat=True),
+            delta
+        )
+
+
+def rebuild_cart_totals(user_ids=None):
+    '''Recalculate totals of shopping carts (of users with user_ids).'''
+    totals = ShoppingCartIngredient.objects.all()
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        totals = totals.filter(user_id__in=user_ids)
+        carts = carts.filter(user_id__in=user_ids)
+    totals.delete()
+    sums = carts.filter(
+        recipe__recipeingredient__ingredient__isnull=False
+    ).values_list(
+        'user_id', 'recipe__recipeingredient__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipeingredient__amount')
+    ).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=pk, amount=total
+            )
+            for user_id, pk, total in sums.iterator()
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def rebuild_recipe_carts(*recipe_ids):
+    '''Recalculate totals of carts containing any of the recipes.'''
+    rebuild_cart_totals(list(ShoppingCart.objects.filter(
+        recipe_id__in=recipe_ids
+    ).values_list('user_id', flat=True).distinct()))
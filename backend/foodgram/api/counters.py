@@ -0,0 +1,29 @@
+'''Recalculation of denormalized counters.
+
+Counters are maintained incrementally by signals (api.signals and
+users.signals); bulk operations bypass signals, so after them counters are
+recalculated from scratch.
+'''
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Recipe
+from users.models import Subscription, User
+
+
+def count_subquery(model, field):
+    '''Return subquery counting rows of model which field refers to pk.'''
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(count=Count('pk')).values('count')
+    ), 0)
+
+
+def recount_counters():
+    '''Recalculate favorites, recipes and followers counters.'''
+    Recipe.objects.update(favorites_count=count_subquery(Favorite, 'recipe'))
+    User.objects.update(
+        recipes_count=count_subquery(Recipe, 'author'),
+        followers_count=count_subquery(Subscription, 'following'),
+    )
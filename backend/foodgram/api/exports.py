@@ -0,0 +1,208 @@
+'''Shopping list export: aggregation, rendering (pdf, txt, csv) and caching.
+
+Rendered documents are cached by a hash of the shopping cart totals
+(ingredients and amounts) and the version of the "ingredients" cache
+namespace (names and units), so repeated downloads of an unchanged cart
+skip the rendering. Amounts are read from materialized cart totals (api.carts).
+'''
+import csv
+import hashlib
+import io
+import os
+import threading
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import cm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .caches import get_version, make_key
+from .models import ShoppingCartIngredient
+from .units import aggregate_amounts
+from foodgram.settings import BASE_DIR
+
+FONT_NAME = 'FreeSans'
+FONT_PATH = os.path.join(BASE_DIR, 'FreeSans.ttf')
+FONT_SIZE = 12
+LINE_HEIGHT = 14
+MARGIN = 2 * cm
+CHUNK_SIZE = 64 * 1024
+CART_BATCH_SIZE = 2000
+FOOTER = 'Thanks! Your shopping list is created by IP.'
+
+ExportFormat = namedtuple(
+    'ExportFormat', ('render', 'content_type', 'filename')
+)
+
+_font_lock = threading.Lock()
+
+
+def register_font():
+    '''Register TTF font once per process.'''
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return
+    with _font_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def get_shopping_list(user):
+    '''Return ingredients of recipes in user's shopping cart with amounts.
+
+    Amounts are materialized totals of the cart (api.carts), read in
+    batches and summed up by product and compatible unit (api.units).
+    '''
+    return aggregate_amounts(
+        ShoppingCartIngredient.objects.filter(user=user).values_list(
+            'ingredient__name',
+            'ingredient__measurement_unit',
+            'amount',
+        ).order_by().iterator(chunk_size=CART_BATCH_SIZE)
+    )
+
+
+def format_line(ingredient):
+    if ingredient['amount'] is None:
+        return '{name} - {measurement_unit}'.format(
+            name=ingredient['ingredient__name'],
+            measurement_unit=ingredient['ingredient__measurement_unit'],
+        )
+    return '{name} ({measurement_unit}) - {amount}'.format(
+        name=ingredient['ingredient__name'],
+        measurement_unit=ingredient['ingredient__measurement_unit'],
+        amount=ingredient['amount'],
+    )
+
+
+def render_pdf(shopping_list):
+    '''Yield pdf document by chunks. Starts a new page when one is full.'''
+    register_font()
+    with SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as file:
+        pdf = canvas.Canvas(file, pagesize=A4)
+        width, height = A4
+        textobject = None
+        lines = [format_line(ingredient) for ingredient in shopping_list]
+        for line in lines + [FOOTER]:
+            if textobject is None or textobject.getY() < MARGIN:
+                if textobject is not None:
+                    pdf.drawText(textobject)
+                    pdf.showPage()
+                textobject = pdf.beginText(MARGIN, height - MARGIN)
+                textobject.setFont(FONT_NAME, FONT_SIZE, leading=LINE_HEIGHT)
+            textobject.textLine(line)
+        pdf.drawText(textobject)
+        pdf.save()
+        file.seek(0)
+        chunk = file.read(CHUNK_SIZE)
+        while chunk:
+            yield chunk
+            chunk = file.read(CHUNK_SIZE)
+
+
+def render_txt(shopping_list):
+    '''Yield plain text document line by line.'''
+    for ingredient in shopping_list:
+        yield (format_line(ingredient) + '\n').encode('utf-8')
+    yield FOOTER.encode('utf-8')
+
+
+def render_csv(shopping_list):
+    '''Yield csv document row by row.'''
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in shopping_list:
+        writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            '' if ingredient['amount'] is None else ingredient['amount'],
+        ))
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+EXPORT_FORMATS = {
+    'pdf': ExportFormat(render_pdf, 'application/pdf', 'List.pdf'),
+    'txt': ExportFormat(render_txt, 'text/plain; charset=utf-8', 'List.txt'),
+    'csv': ExportFormat(render_csv, 'text/csv; charset=utf-8', 'List.csv'),
+}
+
+
+def get_cache_key(user, file_format):
+    '''Return key of the rendered shopping list, None if cart is empty.
+
+    The key is a digest of the user's cart totals, read in batches: changes
+    of recipes outside the cart and of other carts keep it.
+    '''
+    totals = ShoppingCartIngredient.objects.filter(user=user).values_list(
+        'ingredient_id', 'amount'
+    ).order_by('ingredient_id').iterator(chunk_size=CART_BATCH_SIZE)
+    digest = hashlib.md5()
+    empty = True
+    for ingredient_id, amount in totals:
+        digest.update(f'{ingredient_id}:{amount},'.encode('utf-8'))
+        empty = False
+    if empty:
+        return None
+    return make_key(
+        'shopping_list',
+        get_version('ingredients'),
+        user.id,
+        file_format,
+        digest.hexdigest()
+    )
+
+
+def cached_stream(chunks, key):
+    '''Yield chunks, cache the whole document when it is completed.'''
+    parts = []
+    for chunk in chunks:
+        parts.append(chunk)
+        yield chunk
+    cache.set(key, b''.join(parts), settings.SHOPPING_LIST_CACHE_TIMEOUT)
+
+
+def get_shopping_list_chunks(user, file_format):
+    '''Return iterator over chunks of the rendered shopping list.
+
+    Served from cache if the cart has not changed since the last rendering.
+    Returns None if the shopping cart is empty.
+    '''
+    key = get_cache_key(user, file_format)
+    if key is None:
+        return None
+    content = cache.get(key)
+    if content is not None:
+        return (
+            content[i:i + CHUNK_SIZE]
+            for i in range(0, len(content), CHUNK_SIZE)
+        )
+    return cached_stream(
+        EXPORT_FORMATS[file_format].render(get_shopping_list(user)), key
+    )
+
+
+def shopping_list_response(user, file_format):
+    '''Return streaming response with user's shopping list.
+
+    Returns None if the shopping cart is empty.
+    '''
+    chunks = get_shopping_list_chunks(user, file_format)
+    if chunks is None:
+        return None
+    export_format = EXPORT_FORMATS[file_format]
+    response = StreamingHttpResponse(
+        chunks, content_type=export_format.content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment; filename="{export_format.filename}"'
+    )
+    return response
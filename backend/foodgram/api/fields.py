@@ -1,8 +1,103 @@
 import base64
+import binascii
+from contextlib import contextmanager
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+BASE64_PREFIX = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+# Encoders wrap base64 by lines (76 columns in MIME).
+BASE64_WHITESPACE = str.maketrans('', '', ' \t\n\r\x0b\x0c')
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'RIFF', 'webp'),
+)
+
+
+def get_image_type(header):
+    '''Return image type by the first bytes of file or None.'''
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            if image_type == 'webp' and header[8:12] != b'WEBP':
+                return None
+            return image_type
+    return None
+
+
+def iter_base64_chunks(data, start):
+    '''Yield chunks of data after start without whitespace.
+
+    Every chunk but the last one (the rest) is of groups of 4 characters,
+    so chunks are decoded independently.
+    '''
+    rest = ''
+    for position in range(start, len(data), BASE64_CHUNK_SIZE):
+        chunk = rest + data[
+            position:position + BASE64_CHUNK_SIZE
+        ].translate(BASE64_WHITESPACE)
+        split = len(chunk) // 4 * 4
+        chunk, rest = chunk[:split], chunk[split:]
+        if chunk:
+            yield chunk
+    if rest:
+        yield rest
+
+
+def open_image_file(header):
+    '''Return temporary file for image starting with header.'''
+    image_type = get_image_type(header[:16])
+    if image_type is None:
+        raise serializers.ValidationError(
+            'Upload a valid image (jpeg, png, gif or webp).'
+        )
+    return TemporaryUploadedFile(
+        f'image.{image_type}', f'image/{image_type}', 0, None
+    )
+
+
+def decode_base64_image(data):
+    '''Decode data URL (data:image/...;base64,...) into temporary file.
+
+    The string is decoded by chunks straight to a file on disk, so neither
+    split copies nor the whole decoded image are held in memory. Signature
+    and size of the image are checked before the rest is decoded. ASCII
+    whitespace (line wrapping of encoders) is skipped.
+    '''
+    start = data.find(BASE64_PREFIX, 0, 100)
+    if start < 0:
+        raise serializers.ValidationError('Invalid base64 image.')
+    file = None
+    try:
+        for chunk in iter_base64_chunks(data, start + len(BASE64_PREFIX)):
+            decoded = base64.b64decode(chunk, validate=True)
+            if file is None:
+                file = open_image_file(decoded)
+            file.write(decoded)
+            if file.tell() > settings.IMAGE_MAX_UPLOAD_SIZE:
+                raise serializers.ValidationError(
+                    'Image file is too large (max. {} bytes).'.format(
+                        settings.IMAGE_MAX_UPLOAD_SIZE
+                    )
+                )
+    except (binascii.Error, serializers.ValidationError) as error:
+        if file is not None:
+            file.close()
+        if isinstance(error, binascii.Error):
+            raise serializers.ValidationError('Invalid base64 image.')
+        raise
+    if file is None:
+        raise serializers.ValidationError('Empty image.')
+    file.size = file.tell()
+    file.seek(0)
+    return file
 
 
 class Hex2NameColor(serializers.Field):
@@ -23,12 +118,76 @@ class Hex2NameColor(serializers.Field):
 
 
 class Base64ImageField(serializers.ImageField):
-    '''Custom field - saves base64 string as image.'''
+    '''Custom field - saves base64 string as image.
+
+    Accepts a data URL (JSON requests) or a file (multipart requests).
+    '''
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            data = decode_base64_image(data)
 
-            data = ContentFile(base64.b64decode(imgstr), name='image.' + ext)
+        file = super().to_internal_value(data)
+        # Django ImageField attaches the opened (not decoded) image.
+        width, height = file.image.size
+        if width * height > settings.IMAGE_MAX_PIXELS:
+            raise serializers.ValidationError(
+                f'Image is too large: {width}x{height}.'
+            )
+        return file
 
+
+class BulkPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    '''PrimaryKeyRelatedField validating a list of keys by one query.
+
+    With many=True (or as a field of items of a list serializer, see
+    RecipeIngredientListSerializer) objects of all keys are fetched at once
+    instead of a query per item. Invalid keys get the usual errors.
+    '''
+    objects = None
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return BulkManyRelatedField(**list_kwargs)
+
+    @contextmanager
+    def fetched(self, keys):
+        '''Look up objects of the keys fetched by one query in the block.'''
+        queryset = self.get_queryset()
+        field = queryset.model._meta.pk
+        values = set()
+        for key in keys:
+            if isinstance(key, bool):
+                continue
+            try:
+                values.add(field.to_python(key))
+            except ValidationError:
+                continue
+        self.objects = queryset.in_bulk(values)
+        try:
+            yield
+        finally:
+            self.objects = None
+
+    def to_internal_value(self, data):
+        if self.objects is not None and not isinstance(data, bool):
+            try:
+                return self.objects[
+                    self.get_queryset().model._meta.pk.to_python(data)
+                ]
+            except (KeyError, TypeError, ValidationError):
+                pass
         return super().to_internal_value(data)
+
+
+class BulkManyRelatedField(serializers.ManyRelatedField):
+    '''List of BulkPrimaryKeyRelatedField fetched by one query.'''
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            return super().to_internal_value(data)
+        with self.child_relation.fetched(data):
+            return super().to_internal_value(data)
@@ -0,0 +1,186 @@
+'''Recipe image pipeline: re-encoding and thumbnails.
+
+A newly uploaded image is fitted into IMAGE_MAX_SIZE and re-encoded to
+IMAGE_FORMAT without metadata (EXIF, ICC profile, comments) before the
+recipe is saved (api.signals) and named by SHA-256 of the result, so
+identical images are stored once (api.storage). Thumbnails of
+THUMBNAIL_SIZES are generated after commit by a thread pool and stored
+next to the image under names derived from the image name, so they are
+never looked up in the database. Files unused by recipes are removed by
+the "collectimages" command.
+'''
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from PIL import Image, ImageOps
+
+from .caches import invalidate
+from .models import Recipe
+from .storage import image_storage
+from foodgram.replicas import primary_reads
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+THUMBNAILS_DIR = 'thumbnails'
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    '''Return process-wide thumbnail pool, create it on first use.'''
+    return ThreadPoolExecutor(
+        max_workers=settings.IMAGE_WORKERS,
+        thread_name_prefix='thumbnails',
+    )
+
+
+def encode(image, size):
+    '''Return bytes of image fitted into size x size box, no metadata.'''
+    # Resized first: JPEG is decoded at reduced scale (draft), the box is
+    # square, so rotation by EXIF orientation does not change the fit.
+    image.thumbnail((size, size), Image.LANCZOS)
+    image = ImageOps.exif_transpose(image)
+    has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+    mode = 'RGBA' if has_alpha and settings.IMAGE_FORMAT != 'JPEG' else 'RGB'
+    if image.mode != mode:
+        image = image.convert(mode)
+    # Saved image gets only what is passed to save(), drop the rest.
+    image.info = {}
+    buffer = BytesIO()
+    image.save(
+        buffer, settings.IMAGE_FORMAT, quality=settings.IMAGE_QUALITY
+    )
+    return buffer.getvalue()
+
+
+def process_image(file):
+    '''Return re-encoded copy (ContentFile) of the uploaded image file.'''
+    file.seek(0)
+    with Image.open(file) as image:
+        content = encode(image, settings.IMAGE_MAX_SIZE)
+    return ContentFile(content, name='{}.{}'.format(
+        hashlib.sha256(content).hexdigest(),
+        EXTENSIONS[settings.IMAGE_FORMAT]
+    ))
+
+
+def get_thumbnail_name(name, size_name):
+    '''Return storage name of the thumbnail of image with storage name.'''
+    folder, filename = os.path.split(name)
+    root = os.path.splitext(filename)[0]
+    # Size in the name: thumbnail URLs are cached by clients forever.
+    return os.path.join(folder, THUMBNAILS_DIR, '{}-{}-{}.{}'.format(
+        root,
+        size_name,
+        settings.THUMBNAIL_SIZES[size_name],
+        EXTENSIONS[settings.IMAGE_FORMAT]
+    ))
+
+
+def get_thumbnail_urls(recipe, request=None):
+    '''Return {size name: URL} of recipe thumbnails, {} if not ready.'''
+    if not recipe.has_thumbnails:
+        return {}
+    urls = {}
+    for size_name in settings.THUMBNAIL_SIZES:
+        url = image_storage.url(
+            get_thumbnail_name(recipe.image.name, size_name)
+        )
+        urls[size_name] = (
+            request.build_absolute_uri(url) if request is not None else url
+        )
+    return urls
+
+
+def make_thumbnails(name, force=False):
+    '''Generate thumbnails of the image with storage name.
+
+    Existing thumbnails (the image is shared by recipes) are kept unless
+    force is set.
+    '''
+    names = {
+        size_name: get_thumbnail_name(name, size_name)
+        for size_name in settings.THUMBNAIL_SIZES
+    }
+    if not force and all(map(image_storage.exists, names.values())):
+        return
+    with image_storage.open(name) as file, Image.open(file) as image:
+        image.load()
+        for size_name, size in settings.THUMBNAIL_SIZES.items():
+            if image_storage.exists(names[size_name]):
+                image_storage.delete(names[size_name])
+            image_storage.save(
+                names[size_name], ContentFile(encode(image.copy(), size))
+            )
+
+
+def generate_thumbnails(recipe_id, name, force=False):
+    '''Make thumbnails and mark the recipe if its image is still the same.'''
+    close_old_connections()
+    try:
+        make_thumbnails(name, force)
+        # The recipe was just committed: every query of the worker goes to
+        # the primary, replicas may lag behind.
+        with primary_reads():
+            if Recipe.objects.filter(pk=recipe_id, image=name).update(
+                has_thumbnails=True, revision=F('revision') + 1
+            ):
+                invalidate('recipes', f'recipes-{recipe_id}')
+    except Exception:
+        logger.exception('Thumbnails of %s are not generated.', name)
+    finally:
+        close_old_connections()
+
+
+def submit_thumbnails(recipe):
+    '''Queue thumbnails of recipe image after the transaction is committed.'''
+    recipe_id, name = recipe.pk, recipe.image.name
+    transaction.on_commit(
+        lambda: get_executor().submit(generate_thumbnails, recipe_id, name)
+    )
+
+
+def get_image_files(folder):
+    '''Yield storage names of images (not thumbnails) in folder tree.'''
+    directories, files = image_storage.listdir(folder)
+    for filename in files:
+        if not filename.startswith('.'):
+            yield os.path.join(folder, filename)
+    for directory in directories:
+        if directory != THUMBNAILS_DIR:
+            yield from get_image_files(os.path.join(folder, directory))
+
+
+def collect_images(folder, grace=60 * 60, dry_run=False):
+    '''Remove images referenced by no recipe and their thumbnails.
+
+    Reference counts are calculated by the database. Files modified less
+    than grace seconds ago are kept: they may belong to a recipe being
+    saved right now (reused files are touched by ContentAddressedStorage).
+    Return list of removed images.
+    '''
+    references = set(Recipe.objects.values_list('image', flat=True))
+    removed = []
+    for name in get_image_files(folder):
+        if name in references:
+            continue
+        if time.time() - image_storage.get_modified_time(
+            name
+        ).timestamp() < grace:
+            continue
+        removed.append(name)
+        if dry_run:
+            continue
+        image_storage.delete(name)
+        for size_name in settings.THUMBNAIL_SIZES:
+            image_storage.delete(get_thumbnail_name(name, size_name))
+    return removed
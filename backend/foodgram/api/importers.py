@@ -0,0 +1,221 @@
+'''Streaming, idempotent import of ingredients, tags, users and recipes.
+
+Files (JSON arrays or CSV) are read record by record and written by chunks
+with bulk_create, so the whole file is never loaded into memory. Rows which
+already exist (unique constraints; recipes - same author and name) are
+skipped, so an import may be safely repeated. Passwords of users are
+hashed by a process pool.
+
+Recipe records look like:
+{"author": "<username>", "name": "...", "text": "...", "cooking_time": 10,
+ "image": "<path in MEDIA_ROOT>", "tags": ["<slug>", ...],
+ "ingredients": [{"name": "...", "measurement_unit": "...", "amount": 1}]}
+'''
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag
+from users.models import User
+
+BATCH_SIZE = 1000
+READ_SIZE = 64 * 1024
+CSV_FIELDS = {
+    'ingredients': ('name', 'measurement_unit'),
+}
+
+
+def iter_json_array(file, read_size=READ_SIZE):
+    '''Yield items of top-level JSON array reading the file by chunks.'''
+    decoder = json.JSONDecoder()
+    buffer = file.read(read_size).lstrip()
+    if not buffer.startswith('['):
+        raise ValueError('JSON array expected.')
+    buffer = buffer[1:]
+    eof = False
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise
+            chunk = file.read(read_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def iter_records(path, fieldnames=None):
+    '''Yield dicts from JSON array or CSV file (by extension).
+
+    CSV without header row needs fieldnames.
+    '''
+    with open(path, 'r', encoding='utf-8', newline='') as file:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(file, fieldnames=fieldnames)
+        else:
+            yield from iter_json_array(file)
+
+
+def batched(iterable, size):
+    '''Yield lists of size items.'''
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+class Progress:
+    '''Reports number of processed rows and rows per second.'''
+
+    def __init__(self, name, stdout=None):
+        self.name = name
+        self.stdout = stdout
+        self.rows = 0
+        self.started = time.perf_counter()
+
+    @property
+    def rate(self):
+        elapsed = time.perf_counter() - self.started
+        return self.rows / elapsed if elapsed else 0
+
+    def update(self, rows):
+        self.rows += rows
+        if self.stdout:
+            self.stdout.write(
+                f'{self.name}: {self.rows} rows, {self.rate:.0f} rows/sec'
+            )
+
+    def result(self):
+        return {'rows': self.rows, 'rows_per_sec': round(self.rate)}
+
+
+def import_ingredients(path, batch_size=BATCH_SIZE, stdout=None):
+    progress = Progress('ingredients', stdout)
+    for batch in batched(
+        iter_records(path, CSV_FIELDS['ingredients']), batch_size
+    ):
+        Ingredient.objects.bulk_create([
+            Ingredient(
+                name=record['name'].strip(),
+                measurement_unit=record['measurement_unit'].strip()
+            ) for record in batch
+        ], ignore_conflicts=True)
+        progress.update(len(batch))
+    return progress.result()
+
+
+def import_tags(path, batch_size=BATCH_SIZE, stdout=None):
+    progress = Progress('tags', stdout)
+    for batch in batched(iter_records(path), batch_size):
+        Tag.objects.bulk_create(
+            [Tag(**record) for record in batch], ignore_conflicts=True
+        )
+        progress.update(len(batch))
+    return progress.result()
+
+
+def import_users(path, batch_size=BATCH_SIZE, workers=None, stdout=None):
+    '''Import users, hashing passwords in a process pool.'''
+    progress = Progress('users', stdout)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=django.setup
+    ) as executor:
+        for batch in batched(iter_records(path), batch_size):
+            passwords = executor.map(
+                make_password,
+                [record.pop('password') for record in batch],
+                chunksize=max(len(batch) // (workers or 4), 1)
+            )
+            User.objects.bulk_create([
+                User(password=password, **record)
+                for record, password in zip(batch, passwords)
+            ], ignore_conflicts=True)
+            progress.update(len(batch))
+    return progress.result()
+
+
+def import_recipes(path, batch_size=BATCH_SIZE, stdout=None):
+    '''Import recipes together with their ingredients and tags.'''
+    progress = Progress('recipes', stdout)
+    tags = dict(Tag.objects.values_list('slug', 'id'))
+    for batch in batched(iter_records(path), batch_size):
+        with transaction.atomic():
+            import_recipes_batch(batch, tags)
+        progress.update(len(batch))
+    return progress.result()
+
+
+def import_recipes_batch(batch, tags):
+    authors = dict(User.objects.filter(
+        username__in={record['author'] for record in batch}
+    ).values_list('username', 'id'))
+    existing = set(Recipe.objects.filter(
+        author_id__in=authors.values(),
+        name__in={record['name'] for record in batch},
+    ).values_list('author_id', 'name'))
+    records = {}
+    for record in batch:
+        key = (authors.get(record['author']), record['name'])
+        if key[0] is not None and key not in existing:
+            records[key] = record
+    if not records:
+        return
+
+    Recipe.objects.bulk_create([
+        Recipe(
+            author_id=author_id,
+            name=name,
+            text=record['text'],
+            cooking_time=record['cooking_time'],
+            image=record.get('image', ''),
+        ) for (author_id, name), record in records.items()
+    ])
+    # bulk_create does not return ids on every database, so fetch them.
+    recipe_ids = {
+        (author_id, name): recipe_id
+        for recipe_id, author_id, name in Recipe.objects.filter(
+            author_id__in={author_id for author_id, _ in records},
+            name__in={name for _, name in records},
+        ).values_list('id', 'author_id', 'name')
+    }
+    ingredients = {
+        (name, measurement_unit): ingredient_id
+        for ingredient_id, name, measurement_unit in Ingredient.objects.filter(
+            name__in={
+                ingredient['name']
+                for record in records.values()
+                for ingredient in record.get('ingredients', ())
+            }
+        ).values_list('id', 'name', 'measurement_unit')
+    }
+    RecipeIngredient.objects.bulk_create([
+        RecipeIngredient(
+            recipe_id=recipe_ids[key],
+            ingredient_id=ingredients[
+                (ingredient['name'], ingredient['measurement_unit'])
+            ],
+            amount=ingredient['amount'],
+        )
+        for key, record in records.items()
+        for ingredient in record.get('ingredients', ())
+        if (ingredient['name'], ingredient['measurement_unit']) in ingredients
+    ], ignore_conflicts=True)
+    RecipeTag.objects.bulk_create([
+        RecipeTag(recipe_id=recipe_ids[key], tag_id=tags[slug])
+        for key, record in records.items()
+        for slug in record.get('tags', ())
+        if slug in tags
+    ], ignore_conflicts=True)
@@ -0,0 +1,147 @@
+'''Local worker pool rendering shopping list exports in background.
+
+Jobs are executed by a thread pool of the web process, so no external
+broker is required. Jobs are stored in the database (ExportJob) and may be
+polled from any worker process. A job interrupted by a restart of the
+process is failed after EXPORT_JOB_TIMEOUT (the client has to create a new
+one); jobs older than EXPORT_JOB_TTL are deleted with their files by the
+workers (at most once per EXPORT_JOB_TIMEOUT by all processes) and by the
+"cleanexports" command. Workers read from the primary database: the rows
+they need were just committed and may not be on the replicas yet.
+'''
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files import File
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .exports import CHUNK_SIZE, EXPORT_FORMATS, get_shopping_list_chunks
+from .models import ExportJob
+from foodgram.replicas import primary_reads
+
+logger = logging.getLogger(__name__)
+
+EXPORTS_FOLDER = 'exports'
+CLEANUP_KEY = 'export-jobs-cleanup'
+INTERRUPTED_ERROR = 'Job is interrupted.'
+
+
+@lru_cache(maxsize=None)
+def get_executor():
+    '''Return process-wide worker pool, create it on first use.'''
+    return ThreadPoolExecutor(
+        max_workers=settings.EXPORT_WORKERS,
+        thread_name_prefix='export',
+    )
+
+
+def run_export_job(job_id):
+    '''Render shopping list of the job to file.'''
+    close_old_connections()
+    try:
+        with primary_reads():
+            render_export_job(job_id)
+            # Shared cache: one process of all cleans up in the interval.
+            if cache.add(CLEANUP_KEY, True, settings.EXPORT_JOB_TIMEOUT):
+                clean_export_jobs()
+    finally:
+        close_old_connections()
+
+
+def render_export_job(job_id):
+    try:
+        job = ExportJob.objects.select_related('user').get(pk=job_id)
+    except ExportJob.DoesNotExist:
+        logger.warning('Export job %s is not found.', job_id)
+        # Do not leave the job pending if it appears later.
+        ExportJob.objects.filter(pk=job_id).update(
+            status=ExportJob.FAILED, error='Job is not found by the worker.'
+        )
+        return
+    job.status = ExportJob.RUNNING
+    job.save(update_fields=('status',))
+    try:
+        chunks = get_shopping_list_chunks(job.user, job.file_format)
+        with SpooledTemporaryFile(max_size=CHUNK_SIZE * 16) as file:
+            for chunk in chunks or ():
+                file.write(chunk)
+            file.seek(0)
+            job.file.save(
+                EXPORT_FORMATS[job.file_format].filename,
+                File(file),
+                save=False
+            )
+        job.status = ExportJob.DONE
+    except Exception as error:
+        job.status = ExportJob.FAILED
+        job.error = str(error)
+    job.save(update_fields=('status', 'file', 'error'))
+
+
+def submit_export_job(user, file_format):
+    '''Create export job and queue it after the transaction is committed.'''
+    job = ExportJob.objects.create(user=user, file_format=file_format)
+    transaction.on_commit(
+        lambda: get_executor().submit(run_export_job, job.pk)
+    )
+    return job
+
+
+def is_stale(job):
+    '''Return True if the job is pending or running too long.'''
+    return job.status in (ExportJob.PENDING, ExportJob.RUNNING) and (
+        job.created
+        < timezone.now() - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT)
+    )
+
+
+def fail_stale_job(job):
+    '''Mark the job failed if it is stale (see is_stale).'''
+    if is_stale(job) and ExportJob.objects.filter(
+        pk=job.pk, status=job.status
+    ).update(status=ExportJob.FAILED, error=INTERRUPTED_ERROR):
+        job.status = ExportJob.FAILED
+        job.error = INTERRUPTED_ERROR
+
+
+def clean_export_jobs():
+    '''Fail stale jobs, delete expired jobs and files, return counts.'''
+    now = timezone.now()
+    failed = ExportJob.objects.filter(
+        status__in=(ExportJob.PENDING, ExportJob.RUNNING),
+        created__lt=now - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT),
+    ).update(status=ExportJob.FAILED, error=INTERRUPTED_ERROR)
+    expired = now - timedelta(seconds=settings.EXPORT_JOB_TTL)
+    jobs = ExportJob.objects.filter(created__lt=expired)
+    names = list(jobs.exclude(file='').values_list('file', flat=True))
+    deleted, _ = jobs.delete()
+    storage = ExportJob._meta.get_field('file').storage
+    for name in names:
+        storage.delete(name)
+    return failed, deleted, len(names) + delete_unused_files(expired)
+
+
+def delete_unused_files(before):
+    '''Delete files of no job (e.g. of deleted users) older than before.'''
+    storage = ExportJob._meta.get_field('file').storage
+    if not storage.exists(EXPORTS_FOLDER):
+        return 0
+    references = set(
+        ExportJob.objects.exclude(file='').values_list('file', flat=True)
+    )
+    deleted = 0
+    for name in storage.listdir(EXPORTS_FOLDER)[1]:
+        name = os.path.join(EXPORTS_FOLDER, name)
+        if name not in references and storage.get_modified_time(
+            name
+        ) < before:
+            storage.delete(name)
+            deleted += 1
+    return deleted
@@ -0,0 +1,134 @@
+'''Concurrency benchmark of a running server for the "loadtest" command.
+
+Many concurrent clients (asyncio tasks with keep-alive HTTP/1.1
+connections) request the paths in turn for a fixed time. Throughput,
+latency percentiles and errors are reported per concurrency level, so the
+same run against WSGI and ASGI deployments shows how each mode scales.
+'''
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from .benchmarks import percentile
+
+REQUEST = (
+    'GET {path} HTTP/1.1\r\n'
+    'Host: {host}\r\n'
+    'Accept: application/json\r\n'
+    '{headers}'
+    '\r\n'
+)
+
+
+async def read_response(reader):
+    '''Read response, return (status, keep-alive connection or not).'''
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection closed by server.')
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip().lower()
+    if 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding') == 'chunked':
+        size = None
+        while size != 0:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            # Chunk data (none for the last chunk) and its CRLF.
+            await reader.readexactly(size + 2)
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection') != 'close'
+
+
+class LoadTest:
+    '''Concurrent GET requests to paths of the server at base_url.'''
+
+    def __init__(self, base_url, paths, token=None, timeout=30):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        headers = f'Authorization: Token {token}\r\n' if token else ''
+        self.requests = [
+            REQUEST.format(
+                path=url.path.rstrip('/') + path,
+                host=url.netloc,
+                headers=headers,
+            ).encode('latin-1')
+            for path in paths
+        ]
+
+    async def client(self, number, deadline, stats):
+        '''Send requests until deadline over one keep-alive connection.'''
+        connection = None
+        index = number
+        while time.monotonic() < deadline:
+            request = self.requests[index % len(self.requests)]
+            index += 1
+            start = time.monotonic()
+            try:
+                if connection is None:
+                    connection = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port),
+                        self.timeout
+                    )
+                reader, writer = connection
+                writer.write(request)
+                await writer.drain()
+                status, keep_alive = await asyncio.wait_for(
+                    read_response(reader), self.timeout
+                )
+            except (OSError, ValueError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError):
+                stats['errors'] += 1
+                if connection is not None:
+                    connection[1].close()
+                connection = None
+                continue
+            if status >= 400:
+                stats['errors'] += 1
+            else:
+                stats['latencies'].append(time.monotonic() - start)
+            if not keep_alive:
+                writer.close()
+                connection = None
+        if connection is not None:
+            connection[1].close()
+
+    async def run_level(self, concurrency, duration):
+        stats = {'latencies': [], 'errors': 0}
+        deadline = time.monotonic() + duration
+        await asyncio.gather(*[
+            self.client(number, deadline, stats)
+            for number in range(concurrency)
+        ])
+        latencies = stats['latencies']
+        return {
+            'concurrency': concurrency,
+            'requests': len(latencies),
+            'errors': stats['errors'],
+            'requests_per_sec': round(len(latencies) / duration, 1),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        }
+
+    def run(self, levels, duration, warmup=2):
+        '''Return results of every concurrency level (after warmup).'''
+        loop = asyncio.new_event_loop()
+        try:
+            if warmup:
+                loop.run_until_complete(self.run_level(min(levels), warmup))
+            return [
+                loop.run_until_complete(self.run_level(level, duration))
+                for level in levels
+            ]
+        finally:
+            loop.close()
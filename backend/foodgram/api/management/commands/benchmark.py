@@ -0,0 +1,162 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from api.benchmarks import ISOLATED_CACHES, RouteBenchmark, seed_database
+from api.models import Recipe
+from foodgram.querystats import QueryBudgetError
+from foodgram.replicas import set_test_mirrors
+from users.models import User
+
+
+class Command(BaseCommand):
+    '''Benchmark of every API route on a seeded test database.
+
+    Creates a test database (the working database is never touched), seeds
+    it and prints JSON with p50/p95 latency, number of SQL queries (with
+    warm and cleared caches) and fetched rows per route:
+
+    python manage.py benchmark --output bench.json
+    python manage.py benchmark --baseline bench.json --tolerance 0.2
+
+    With --strict-queries a route exceeding query budget of its view or
+    repeating a query (foodgram/querystats.py) fails the run.
+    '''
+    help = 'Measures latency, SQL queries and rows of every API route.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=50000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument(
+            '--favorites', type=int, default=30,
+            help='Favorite recipes per user.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=10,
+            help='Recipes in shopping cart per user.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=20,
+            help='Subscriptions per user.'
+        )
+        parser.add_argument('--ingredients-file', default=None)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--tag-sweep', type=int, default=10,
+            help='Compare tag filter strategies for 1..N tags (0 - skip).'
+        )
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep (and reuse already seeded) test database.'
+        )
+        parser.add_argument('--output', help='Write JSON to the file.')
+        parser.add_argument(
+            '--baseline',
+            help='JSON of a previous run; fail on regressions against it.'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed relative p95 latency growth against baseline.'
+        )
+        parser.add_argument(
+            '--strict-queries', action='store_true',
+            help='Fail on routes over their query budget or with N+1.'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(
+            verbosity=0, keepdb=options['keepdb'], serialize=False
+        )
+        set_test_mirrors()
+        try:
+            with override_settings(
+                CACHES=ISOLATED_CACHES, SQL_STRICT=options['strict_queries']
+            ):
+                report = self.benchmark(options)
+        except QueryBudgetError as error:
+            raise CommandError(error)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'], options['tolerance'])
+
+    def benchmark(self, options):
+        volumes = None
+        if not Recipe.objects.exists():
+            volumes = seed_database(
+                users=options['users'],
+                recipes=options['recipes'],
+                tags=options['tags'],
+                favorites=options['favorites'],
+                carts=options['carts'],
+                subscriptions=options['subscriptions'],
+                ingredients_file=options['ingredients_file'],
+                seed=options['seed'],
+                stdout=self.stderr,
+            )
+        self.stderr.write('Measuring routes...')
+        benchmark = RouteBenchmark(
+            User.objects.get(username='bench0'),
+            iterations=options['iterations'],
+            warmup=options['warmup'],
+        )
+        report = {
+            'database': connection.vendor,
+            'volumes': volumes,
+            'routes': benchmark.run(),
+        }
+        if options['tag_sweep']:
+            self.stderr.write('Measuring tag filters...')
+            report['tag_filter'] = benchmark.tag_sweep(options['tag_sweep'])
+        return report
+
+    def compare(self, report, baseline_path, tolerance):
+        '''Raise CommandError if queries or p95 latency regressed.'''
+        with open(baseline_path, 'r', encoding='utf-8') as file:
+            baseline = {
+                (route['name'], route['method'], route['anonymous']): route
+                for route in json.load(file)['routes']
+            }
+        regressions = []
+        for route in report['routes']:
+            previous = baseline.get(
+                (route['name'], route['method'], route['anonymous'])
+            )
+            if previous is None:
+                continue
+            for field, label in (
+                ('queries', 'queries'), ('queries_cold', 'cold queries')
+            ):
+                if route[field] > previous.get(field, route[field]):
+                    regressions.append(
+                        '{name} {method}: {old} -> {new} {label}'.format(
+                            old=previous[field], new=route[field],
+                            label=label, **route
+                        )
+                    )
+            if route['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+                regressions.append(
+                    '{name} {method}: p95 {old} -> {new} ms'.format(
+                        old=previous['p95_ms'], new=route['p95_ms'], **route
+                    )
+                )
+        if regressions:
+            raise CommandError(
+                'Performance regressions:\n' + '\n'.join(regressions)
+            )
@@ -0,0 +1,83 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import override_settings
+
+from api.benchmarks import ISOLATED_CACHES, seed_database
+from api.models import Recipe
+from api.plans import check_plans
+from foodgram.replicas import set_test_mirrors
+from users.models import User
+
+
+class Command(BaseCommand):
+    '''Checks that recipe filters are served by indexes.
+
+    Creates and seeds a test database (the working database is never
+    touched), runs EXPLAIN for the first page of the recipe list with every
+    combination of filters and fails if a large table is read by a full
+    scan:
+
+    python manage.py checkindexes --recipes 20000 --verbose
+    '''
+    help = 'Fails if recipe list filters make full scans of large tables.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--recipes', type=int, default=20000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=30)
+        parser.add_argument('--carts', type=int, default=10)
+        parser.add_argument('--subscriptions', type=int, default=5)
+        parser.add_argument('--ingredients-file', default=None)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--keepdb', action='store_true',
+            help='Keep (and reuse already seeded) test database.'
+        )
+        parser.add_argument(
+            '--verbose', action='store_true', help='Print every plan.'
+        )
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(
+            verbosity=0, keepdb=options['keepdb'], serialize=False
+        )
+        set_test_mirrors()
+        try:
+            with override_settings(CACHES=ISOLATED_CACHES):
+                results = self.explain(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(
+                old_name, verbosity=0, keepdb=options['keepdb']
+            )
+
+        failed = [result for result in results if result['full_scans']]
+        for result in results:
+            status = 'FULL SCAN: ' + ', '.join(
+                result['full_scans']
+            ) if result['full_scans'] else 'ok'
+            self.stdout.write(f'{result["name"]}: {status}')
+            if options['verbose'] or result['full_scans']:
+                self.stdout.write(f'  ?{result["query"]}')
+                self.stdout.write('  ' + result['plan'].replace('\n', '\n  '))
+        if failed:
+            raise CommandError(
+                f'{len(failed)} of {len(results)} filter combinations '
+                'are not served by indexes.'
+            )
+
+    def explain(self, options):
+        if not Recipe.objects.exists():
+            seed_database(
+                users=options['users'],
+                recipes=options['recipes'],
+                tags=options['tags'],
+                favorites=options['favorites'],
+                carts=options['carts'],
+                subscriptions=options['subscriptions'],
+                ingredients_file=options['ingredients_file'],
+                seed=options['seed'],
+                stdout=self.stderr,
+            )
+        return check_plans(User.objects.get(username='bench0'))
@@ -0,0 +1,22 @@
+from django.core.management import BaseCommand
+
+from api.jobs import clean_export_jobs
+
+
+class Command(BaseCommand):
+    '''Fails interrupted export jobs, deletes expired jobs and files.
+
+    Jobs pending or running longer than EXPORT_JOB_TIMEOUT are failed,
+    jobs and files in the exports folder older than EXPORT_JOB_TTL are
+    deleted. Export workers do the same at most once per EXPORT_JOB_TIMEOUT.
+
+    python manage.py cleanexports
+    '''
+    help = 'Fails interrupted export jobs, deletes expired jobs and files.'
+
+    def handle(self, *args, **options):
+        failed, deleted, files = clean_export_jobs()
+        self.stdout.write(
+            f'Failed {failed} interrupted jobs, deleted {deleted} expired '
+            f'jobs and {files} unused files.'
+        )
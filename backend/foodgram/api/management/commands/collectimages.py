@@ -0,0 +1,35 @@
+from django.core.management import BaseCommand
+
+from api.images import collect_images
+
+IMAGES_FOLDER = 'media/recipes/images'
+
+
+class Command(BaseCommand):
+    '''Removes recipe images (and thumbnails) not used by any recipe.
+
+    python manage.py collectimages --grace 3600 --dry-run
+    '''
+    help = 'Removes recipe images and thumbnails not used by any recipe.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=60 * 60,
+            help='Keep files modified less than GRACE seconds ago.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only print files which would be removed.'
+        )
+
+    def handle(self, *args, **options):
+        removed = collect_images(
+            IMAGES_FOLDER, options['grace'], options['dry_run']
+        )
+        for name in removed:
+            self.stdout.write(name)
+        self.stdout.write(
+            '{} {} unused images.'.format(
+                'Found' if options['dry_run'] else 'Removed', len(removed)
+            )
+        )
@@ -0,0 +1,78 @@
+import json
+
+from django.core.management import BaseCommand, CommandError
+
+from api.loadtest import LoadTest
+
+DEFAULT_PATHS = (
+    '/api/tags/',
+    '/api/ingredients/?name=%D1%81%D0%B0',
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+)
+AUTHENTICATED_PATHS = ('/api/users/subscriptions/',)
+
+
+class Command(BaseCommand):
+    '''Concurrency benchmark of running servers (WSGI against ASGI mode).
+
+    Requests read routes of every target with 100-1000 concurrent clients
+    and prints JSON with requests/sec and latency per concurrency level:
+
+    python manage.py loadtest --target wsgi=http://127.0.0.1:8000 \\
+        --target asgi=http://127.0.0.1:8001 --token <token>
+
+    Every client keeps a connection open: raise the open files limit
+    (ulimit -n) of the shell and the servers for 1000 clients.
+    '''
+    help = 'Measures requests/sec of running servers under concurrency.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True,
+            help='name=base URL of a running server, e.g. '
+                 'asgi=http://127.0.0.1:8001 (repeat for every server).'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+',
+            default=[100, 250, 500, 1000]
+        )
+        parser.add_argument(
+            '--duration', type=int, default=10,
+            help='Seconds of every concurrency level.'
+        )
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--timeout', type=int, default=30)
+        parser.add_argument(
+            '--path', action='append',
+            help='Path to request (repeat; default - read routes).'
+        )
+        parser.add_argument(
+            '--token', help='Authenticate requests by the token.'
+        )
+        parser.add_argument('--output', help='Write JSON to the file.')
+
+    def handle(self, *args, **options):
+        paths = options['path'] or list(DEFAULT_PATHS) + (
+            list(AUTHENTICATED_PATHS) if options['token'] else []
+        )
+        report = {'paths': paths, 'duration': options['duration']}
+        for target in options['target']:
+            name, separator, url = target.partition('=')
+            if not separator or not url.startswith('http://'):
+                raise CommandError(
+                    f'Target "{target}" is not name=http://host:port.'
+                )
+            self.stderr.write(f'Measuring {name} ({url})...')
+            report[name] = LoadTest(
+                url, paths, options['token'], options['timeout']
+            ).run(
+                options['concurrency'], options['duration'],
+                options['warmup']
+            )
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output)
+        else:
+            self.stdout.write(output)
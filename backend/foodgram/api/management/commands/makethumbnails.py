@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+
+from api.images import generate_thumbnails, get_executor
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Generates missing thumbnails of recipe images (--all: every).'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regenerate thumbnails of all recipes.'
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='')
+        if not options['all']:
+            recipes = recipes.filter(has_thumbnails=False)
+        tasks = [
+            get_executor().submit(
+                generate_thumbnails, recipe_id, name, options['all']
+            )
+            for recipe_id, name in recipes.values_list('id', 'image')
+        ]
+        for task in tasks:
+            task.result()
+        self.stdout.write(f'Thumbnails generated for {len(tasks)} recipes.')
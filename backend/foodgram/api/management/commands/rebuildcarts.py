@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.carts import rebuild_cart_totals
+
+
+class Command(BaseCommand):
+    help = 'Recalculates totals of ingredients in shopping carts.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_cart_totals()
+        self.stdout.write('Shopping cart totals recalculated.')
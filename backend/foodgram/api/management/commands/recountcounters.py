@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from api.counters import recount_counters
+
+
+class Command(BaseCommand):
+    help = 'Recalculates favorites, recipes and followers counters.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount_counters()
+        self.stdout.write('Counters recalculated.')
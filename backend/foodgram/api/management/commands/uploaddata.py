@@ -1,65 +1,94 @@
-import json
 import os
 
 from django.core.management import BaseCommand
+from django.db import transaction
 
-from api.models import Ingredient, Tag
+from api.caches import invalidate
+from api.counters import recount_counters
+from api.importers import (BATCH_SIZE, import_ingredients, import_recipes,
+                           import_tags, import_users)
 from foodgram.settings import BASE_DIR
 from users.models import User
 
+IMPORTERS = (
+    ('ingredients', import_ingredients),
+    ('tags', import_tags),
+    ('users', import_users),
+    ('recipes', import_recipes),
+)
+
 
 class Command(BaseCommand):
+    '''Loads data from /data/ folder (or --path).
+
+    For every catalog (ingredients, tags, users, recipes) <name>.json or
+    <name>.csv is imported if it exists. Files are streamed and written by
+    chunks, existing rows are skipped, so the command may be re-run.
+    Single file may be set explicitly: --ingredients ../../data/ingredients.csv
+    '''
     # Show this when the user types help
     help = "Loads data from /data/ folder."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default=os.path.join(BASE_DIR, 'data'),
+            help='Folder with data files.'
+        )
+        for name, _ in IMPORTERS:
+            parser.add_argument(
+                f'--{name}', help=f'File with {name} (json or csv).'
+            )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Processes hashing passwords (default - number of CPUs).'
+        )
+
     def handle(self, *args, **options):
         # Show this before loading the data into the database
-        print("Loading data")
-        superuser = User.objects.create(
+        self.stdout.write("Loading data")
+        self.create_superuser()
+
+        for name, importer in IMPORTERS:
+            path = options[name] or self.find_file(options['path'], name)
+            if path is None:
+                continue
+            kwargs = {'batch_size': options['batch_size']}
+            if name == 'users':
+                kwargs['workers'] = options['workers']
+            result = importer(path, stdout=self.stdout, **kwargs)
+            self.stdout.write(
+                '{name} imported from {path}: {rows} rows, '
+                '{rows_per_sec} rows/sec'.format(
+                    name=name, path=path, **result
+                )
+            )
+
+        # bulk_create does not send signals: recalculate counters and
+        # invalidate cached catalogs here.
+        with transaction.atomic():
+            recount_counters()
+        invalidate('tags', 'ingredients', 'recipes')
+        self.stdout.write("Data upload finished.")
+
+    def find_file(self, folder, name):
+        for extension in ('json', 'csv'):
+            path = os.path.join(folder, f'{name}.{extension}')
+            if os.path.exists(path):
+                return path
+        return None
+
+    def create_superuser(self):
+        if User.objects.filter(username='admin').exists():
+            return
+        superuser = User(
             username='admin',
             email='admin@admin.ru',
             role='admin',
             first_name='admin',
-            last_name='admin'
+            last_name='admin',
+            is_staff=True,
+            is_superuser=True,
         )
         superuser.set_password('1q2w3e4r5t6y7u8i9o0p')
-        superuser.is_staff = True
-        superuser.is_superuser = True
         superuser.save()
-
-        with open(
-            os.path.join(BASE_DIR, 'data/ingredients.json'),
-            'r', encoding='utf-8', newline=''
-        ) as jsonfile:
-            ingredients = json.load(jsonfile)
-            datadict = {}
-            for ingredient in ingredients:
-                datadict[ingredient['name']] = ingredient['measurement_unit']
-
-            Ingredient.objects.bulk_create([
-                Ingredient(
-                    name=name, measurement_unit=measurement_unit
-                ) for name, measurement_unit in datadict.items()
-            ])
-
-        with open(
-            os.path.join(BASE_DIR, 'data/tags.json'),
-            'r', encoding='utf-8', newline=''
-        ) as jsonfile:
-            tags = json.load(jsonfile)
-            Tag.objects.bulk_create([
-                Tag(**tag) for tag in tags
-            ])
-
-        with open(
-            os.path.join(BASE_DIR, 'data/users.json'),
-            'r', encoding='utf-8', newline=''
-        ) as jsonfile:
-            users = json.load(jsonfile)
-            for user in users:
-                password = user.pop('password')
-                instance = User.objects.create(**user)
-                instance.set_password(password)
-                instance.save()
-
-        print("Data upload finished.")
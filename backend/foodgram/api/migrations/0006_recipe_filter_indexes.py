@@ -0,0 +1,42 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:04
+
+from django.db import migrations, models
+
+# Postgres only: covering partial index, shopping list aggregation reads
+# amounts from the index without visiting the table (index-only scan).
+SHOPPING_LIST_INDEX = (
+    'CREATE INDEX IF NOT EXISTS recipe_ingredient_amount_idx '
+    'ON api_recipeingredient (recipe_id) INCLUDE (ingredient_id, amount) '
+    'WHERE ingredient_id IS NOT NULL'
+)
+
+
+def create_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(SHOPPING_LIST_INDEX)
+
+
+def drop_postgres_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipe_ingredient_amount_idx'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipetag',
+            index=models.Index(fields=['tag', 'recipe'], name='recipe_tag_tag_idx'),
+        ),
+        migrations.RunPython(create_postgres_indexes, drop_postgres_indexes),
+    ]
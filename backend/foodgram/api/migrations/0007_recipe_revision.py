@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_recipe_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Ревизия'),
+        ),
+    ]
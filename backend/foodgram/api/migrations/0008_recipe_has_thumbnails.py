@@ -0,0 +1,18 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_recipe_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='has_thumbnails',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Есть миниатюры'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:14
+
+import api.models
+import api.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_recipe_has_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(storage=api.storage.ContentAddressedStorage(), upload_to=api.models.get_upload_path, verbose_name='Изображение'),
+        ),
+    ]
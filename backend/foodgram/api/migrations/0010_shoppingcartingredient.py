@@ -0,0 +1,56 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:17
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+import django.db.models.deletion
+
+
+def fill_cart_totals(apps, schema_editor):
+    ShoppingCart = apps.get_model('api', 'ShoppingCart')
+    ShoppingCartIngredient = apps.get_model('api', 'ShoppingCartIngredient')
+    sums = ShoppingCart.objects.filter(
+        recipe__recipeingredient__ingredient__isnull=False
+    ).values_list(
+        'user_id', 'recipe__recipeingredient__ingredient_id'
+    ).annotate(
+        total=Sum('recipe__recipeingredient__amount')
+    ).order_by()
+    ShoppingCartIngredient.objects.bulk_create(
+        (
+            ShoppingCartIngredient(
+                user_id=user_id, ingredient_id=pk, amount=total
+            )
+            for user_id, pk, total in sums.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_recipe_image_storage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingCartIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='in_shopping_carts', to='api.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_ingredients', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент в корзине',
+                'verbose_name_plural': 'Ингредиенты в корзине',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppingcartingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='shopping_cart_ingredient_unique_relationships'),
+        ),
+        migrations.RunPython(fill_cart_totals, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,14 @@
-from rest_framework import mixins, viewsets
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import mixins, status, viewsets
+from rest_framework.response import Response
+
+from .caches import get_version, make_key
+from foodgram.replicas import primary_reads
 
 
 class ListRetrieveViewSet(
@@ -16,3 +26,170 @@ class ListViewSet(
 ):
     '''Mixin class to get all Model objects.'''
     pass
+
+
+class CachedCatalogMixin:
+    '''Mixin class to serve list and retrieve from versioned cache.
+
+    Responses are cached per URL under the version of cache_namespace (see
+    api.caches). ETag is calculated from the version only, so conditional
+    requests with If-None-Match are answered with 304 without touching
+    the database.
+    '''
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = get_version(self.cache_namespace)
+        url = request.build_absolute_uri()
+        etag = '"{}"'.format(
+            make_key(self.cache_namespace, version, url).replace(':', '-')
+        )
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = make_key(self.cache_namespace, version, url)
+            data = cache.get(key)
+            if data is None:
+                with primary_reads():
+                    response = handler(request, *args, **kwargs)
+                if response.status_code == status.HTTP_200_OK:
+                    cache.set(
+                        key, response.data, settings.CATALOG_CACHE_TIMEOUT
+                    )
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        patch_cache_control(
+            response,
+            public=True,
+            max_age=settings.CATALOG_CACHE_MAX_AGE,
+            must_revalidate=True,
+        )
+        return response
+
+
+class CursorPaginationMixin:
+    '''Mixin class switching the viewset to cursor pagination on request.
+
+    Cursor pagination (cursor_pagination_class) is used if query has
+    "pagination=cursor" or "cursor" parameter, otherwise pagination_class
+    (page numbers) is used for backward compatibility.
+    '''
+    cursor_pagination_class = None
+
+    @property
+    def paginator(self):
+        params = self.request.query_params
+        if (
+            not hasattr(self, '_paginator')
+            and self.cursor_pagination_class is not None
+            and (params.get('pagination') == 'cursor' or 'cursor' in params)
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
+
+
+class AnonymousCacheMixin:
+    '''Mixin class to serve list and retrieve to anonymous users from cache.
+
+    Anonymous users get identical pages, so serialized data is cached per
+    normalized URL. List pages are versioned by cache_namespace, single
+    objects by their own "<cache_namespace>-<lookup>" namespace and
+    cache_detail_namespaces (related catalogs). Responses have ETag and
+    Last-Modified (time of rendering), conditional requests are answered
+    with 304.
+    '''
+    cache_namespace = None
+    cache_detail_namespaces = ()
+
+    def list(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().list(request, *args, **kwargs)
+        return self.anonymous_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().retrieve(request, *args, **kwargs)
+        return self.anonymous_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cache_version(self):
+        namespaces = (self.cache_namespace,)
+        if self.action == 'retrieve':
+            namespaces = (
+                '{}-{}'.format(
+                    self.cache_namespace, self.kwargs[self.lookup_field]
+                ),
+            ) + tuple(self.cache_detail_namespaces)
+        return '-'.join(
+            str(get_version(namespace)) for namespace in namespaces
+        )
+
+    def get_cache_url(self, request):
+        '''Return URL with sorted query parameters and values.'''
+        params = sorted(
+            (name, sorted(set(filter(None, values))))
+            for name, values in request.query_params.lists()
+        )
+        return '{}?{}'.format(
+            request.build_absolute_uri(request.path),
+            '&'.join(
+                f'{name}={value}' for name, values in params
+                for value in values
+            )
+        )
+
+    def anonymous_response(self, handler, request, *args, **kwargs):
+        version = self.get_cache_version()
+        key = make_key(
+            self.cache_namespace, version, self.get_cache_url(request)
+        )
+        etag = '"{}"'.format(key.replace(':', '-'))
+        if etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+            return self.patch_anonymous_response(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag
+            )
+        entry = cache.get(key)
+        if entry is None:
+            with primary_reads():
+                response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            last_modified = int(time.time())
+            cache.set(
+                key,
+                (response.data, last_modified),
+                settings.RECIPE_CACHE_TIMEOUT
+            )
+        else:
+            data, last_modified = entry
+            response = Response(data)
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', '')
+        )
+        if (
+            'HTTP_IF_NONE_MATCH' not in request.META
+            and if_modified_since is not None
+            and if_modified_since >= last_modified
+        ):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        response['Last-Modified'] = http_date(last_modified)
+        return self.patch_anonymous_response(response, etag)
+
+    def patch_anonymous_response(self, response, etag):
+        response['ETag'] = etag
+        # Authenticated users get other pages: shared caches must not mix.
+        patch_vary_headers(response, ('Authorization',))
+        patch_cache_control(
+            response, public=True, max_age=0, must_revalidate=True
+        )
+        return response
@@ -1,16 +1,22 @@
 import os
+import uuid
 
 from django.core.validators import MinValueValidator
 from django.db import models
 
+from .storage import image_storage
 from foodgram.settings import CHARFIELD_MAX_LENGTH, NAMES_MAX_LENGTH
 from users.models import User
 
 
 def get_upload_path(instance, filename):
-    '''Returns an upload path to image based on Recipe instance name.'''
+    '''Returns content addressed upload path of image.
+
+    Images are named by SHA-256 of their content (api.images) and sharded
+    by the first two pairs of hex digits: media/recipes/images/ab/cd/abcd...
+    '''
     return os.path.join(
-        "media/recipes/images/", f"{instance.name}-{filename}"
+        "media/recipes/images/", filename[:2], filename[2:4], filename
     )
 
 
@@ -85,6 +91,7 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to=get_upload_path,
+        storage=image_storage,
         null=False,
         blank=False,
         verbose_name='Изображение'
@@ -115,11 +122,40 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    # Denormalized counter, maintained by api.signals.
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    # Set when thumbnails of the current image are generated (api.images).
+    has_thumbnails = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Есть миниатюры'
+    )
+    # Incremented on every update, versions cached serialized recipe.
+    revision = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Ревизия'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            # Default ordering and cursor pagination.
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+            # Author's page and subscriptions: filter and order by index.
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
@@ -185,6 +221,10 @@ class RecipeTag(models.Model):
                 fields=["recipe", "tag"],
             ),
         ]
+        indexes = [
+            # Tags filter: recipes by tag without reading the table.
+            models.Index(fields=['tag', 'recipe'], name='recipe_tag_tag_idx'),
+        ]
 
 
 class RecipeListeBaseModel(models.Model):
@@ -238,3 +278,86 @@ class ShoppingCart(RecipeListeBaseModel):
                 fields=["user", "recipe"],
             ),
         ]
+
+
+class ShoppingCartIngredient(models.Model):
+    '''Total amount of ingredient in user's shopping cart.
+
+    Materialized sum over recipes in the cart, maintained by api.carts.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='cart_ingredients',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='in_shopping_carts',
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество'
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        constraints = [
+            models.UniqueConstraint(
+                name="shopping_cart_ingredient_unique_relationships",
+                fields=["user", "ingredient"],
+            ),
+        ]
+
+
+class ExportJob(models.Model):
+    '''Background job rendering user's shopping list to file.'''
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='export_jobs',
+        verbose_name='Пользователь',
+    )
+    file_format = models.CharField(
+        max_length=CHARFIELD_MAX_LENGTH,
+        verbose_name='Формат файла',
+    )
+    status = models.CharField(
+        max_length=CHARFIELD_MAX_LENGTH,
+        choices=STATUSES,
+        default=PENDING,
+        verbose_name='Статус',
+    )
+    file = models.FileField(
+        upload_to='exports/',
+        blank=True,
+        verbose_name='Файл',
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата создания'
+    )
+
+    class Meta:
+        ordering = ('-created',)
+        verbose_name = 'Выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списков покупок'
+
+    def __str__(self) -> str:
+        return f'{self.user}-{self.file_format}-{self.status}'
@@ -1,11 +1,38 @@
+from django.conf import settings
 from rest_framework import pagination
 
 
 class RecipePagination(pagination.PageNumberPagination):
-    '''Standart pagination. Used only for Recipe and Subscription viewsets.'''
+    '''Standart pagination. Used only for Recipe and Subscription viewsets.
+
+    Page size is set by "limit" query parameter, but not more than
+    MAX_PAGE_SIZE.
+    '''
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
     def get_page_size(self, request):
-        if request.query_params.get('limit'):
-            return request.query_params.get('limit')
-        if request.query_params.get('is_in_shopping_cart'):
+        if (
+            self.page_size_query_param not in request.query_params
+            and request.query_params.get('is_in_shopping_cart')
+        ):
             return 100
-        return 6
+        return super().get_page_size(request)
+
+
+class RecipeCursorPagination(pagination.CursorPagination):
+    '''Keyset pagination by (pub_date, id) for Recipe viewset.
+
+    Does not count objects and does not scan skipped rows: next page starts
+    from the position encoded in the cursor.
+    '''
+    ordering = ('-pub_date', '-id')
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = settings.MAX_PAGE_SIZE
+
+
+class SubscriptionCursorPagination(RecipeCursorPagination):
+    '''Keyset pagination for Subscription viewset (latest first).'''
+    ordering = ('-id',)
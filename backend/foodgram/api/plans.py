@@ -0,0 +1,88 @@
+'''EXPLAIN checks of recipe list queries for the "checkindexes" command.
+
+Every combination of RecipeFilter parameters is turned into the same query
+RecipeViewSet runs for the first page, its plan is read with EXPLAIN and
+searched for full scans of the large tables.
+'''
+import re
+from itertools import combinations
+
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from .models import Recipe, Tag
+from .views import RecipeViewSet
+
+LARGE_TABLES = (
+    'api_recipe',
+    'api_recipetag',
+    'api_recipeingredient',
+    'api_favorite',
+    'api_shoppingcart',
+)
+# Full scan lines of sqlite ("SCAN api_recipe", "SCAN TABLE api_recipe")
+# and Postgres ("Seq Scan on api_recipe") plans. Scans of an index
+# ("SCAN api_recipe USING INDEX ...") are fine.
+FULL_SCAN_PATTERNS = {
+    'sqlite': r'\bSCAN (?:TABLE )?({tables})\b(?! USING)',
+    'postgresql': r'\bSeq Scan on ({tables})\b',
+}
+
+
+def get_filter_params():
+    '''Return names and query strings of filter combinations to check.'''
+    slugs = list(Tag.objects.values_list('slug', flat=True)[:3])
+    author = Recipe.objects.values_list('author_id', flat=True).first()
+    options = {
+        'author': f'author={author}',
+        'tag': f'tags={slugs[0]}',
+        'tags': '&'.join(f'tags={slug}' for slug in slugs),
+        'favorited': 'is_favorited=1',
+        'cart': 'is_in_shopping_cart=1',
+    }
+    yield 'ordering', ''
+    for size in (1, 2):
+        for names in combinations(options, size):
+            if {'tag', 'tags'} <= set(names):
+                continue
+            yield '+'.join(names), '&'.join(options[name] for name in names)
+
+
+def get_page_queryset(user, query, limit=6):
+    '''Return queryset of the first page of RecipeViewSet list.'''
+    request = Request(APIRequestFactory().get('/api/recipes/?' + query))
+    request.user = user
+    view = RecipeViewSet(
+        request=request, action='list', format_kwarg=None, kwargs={}
+    )
+    return view.filter_queryset(view.get_queryset())[:limit]
+
+
+def find_full_scans(plan, vendor=None):
+    '''Return large tables read by full scan according to EXPLAIN output.'''
+    pattern = FULL_SCAN_PATTERNS[vendor or connection.vendor].format(
+        tables='|'.join(LARGE_TABLES)
+    )
+    return sorted(set(re.findall(pattern, plan)))
+
+
+def check_plans(user):
+    '''Explain every filter combination, return list of results.'''
+    if connection.vendor not in FULL_SCAN_PATTERNS:
+        raise NotImplementedError(
+            f'EXPLAIN checks are not supported on {connection.vendor}.'
+        )
+    with connection.cursor() as cursor:
+        # Fresh statistics, otherwise planner guesses on the seeded tables.
+        cursor.execute('ANALYZE')
+    results = []
+    for name, query in get_filter_params():
+        plan = get_page_queryset(user, query).explain()
+        results.append({
+            'name': name,
+            'query': query,
+            'full_scans': find_full_scans(plan),
+            'plan': plan,
+        })
+    return results
@@ -0,0 +1,138 @@
+'''In-process autocomplete index for the ingredient catalog.
+
+Names are kept in a sorted array, so "starts with" matches are found by
+binary search. "Contains" matches are found through n-gram posting lists
+and ranked by position of the match, like IngredientSearchFilter does.
+The index is rebuilt when version of the "ingredients" cache namespace
+changes (see api.caches and api.signals; the cache is shared, so every
+worker picks up changes of the catalog). Every INGREDIENT_INDEX_CHECK_INTERVAL
+seconds the number and the maximum id of ingredients are compared too, so
+ingredients added or deleted while the version was not shared (per-process
+cache) or lost (cache restart) are found as well.
+'''
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .caches import get_version
+from .models import Ingredient
+from foodgram.replicas import primary_reads
+
+NGRAM_SIZES = (2, 3)
+
+
+def ngrams(value, size):
+    return {value[i:i + size] for i in range(len(value) - size + 1)}
+
+
+class IngredientIndex:
+    '''Sorted prefix array with bigram/trigram fallback for "contains".'''
+
+    def __init__(self):
+        self.version = None
+        self.fingerprint = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+        # names, ingredients and postings are replaced together on rebuild.
+        self.state = ([], [], {})
+
+    def build(self, ingredients):
+        '''Build index from iterable of (id, name, measurement_unit).'''
+        rows = sorted(
+            (name.lower(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in ingredients
+        )
+        names = [row[0] for row in rows]
+        ingredients = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in rows
+        ]
+        postings = {}
+        for position, name in enumerate(names):
+            for size in NGRAM_SIZES:
+                for ngram in ngrams(name, size):
+                    postings.setdefault(ngram, []).append(position)
+        self.state = (names, ingredients, postings)
+
+    def is_fresh(self, version):
+        return version == self.version and (
+            time.monotonic() - self.checked
+            < settings.INGREDIENT_INDEX_CHECK_INTERVAL
+        )
+
+    def reset(self):
+        '''Make the next refresh() check the catalog and rebuild.'''
+        self.version = None
+        self.fingerprint = None
+        self.checked = 0.0
+
+    def refresh(self):
+        '''Rebuild the index if the ingredient catalog has changed.'''
+        version = get_version('ingredients')
+        if self.is_fresh(version):
+            return
+        with self.lock:
+            if self.is_fresh(version):
+                return
+            with primary_reads():
+                fingerprint = Ingredient.objects.aggregate(
+                    count=Count('id'), max_id=Max('id')
+                )
+                if (
+                    version != self.version
+                    or fingerprint != self.fingerprint
+                ):
+                    self.build(Ingredient.objects.values_list(
+                        'id', 'name', 'measurement_unit'
+                    ))
+            self.version = version
+            self.fingerprint = fingerprint
+            self.checked = time.monotonic()
+
+    def candidates(self, value, names, postings):
+        '''Return positions of names which may contain value.'''
+        if len(value) < min(NGRAM_SIZES):
+            return range(len(names))
+        size = min(len(value), max(NGRAM_SIZES))
+        lists = sorted(
+            (postings.get(ngram, ()) for ngram in ngrams(value, size)),
+            key=len
+        )
+        positions = set(lists[0])
+        for posting in lists[1:]:
+            positions.intersection_update(posting)
+            if not positions:
+                break
+        return positions
+
+    def search(self, value):
+        '''Return ingredients which name starts with value OR contains value.
+
+        Case insensitive. Ingredients, which names STARTS WITH the value,
+        comes first (alphabetically), then other ones by position of value.
+        '''
+        self.refresh()
+        names, ingredients, postings = self.state
+        value = value.lower()
+
+        start = bisect_left(names, value)
+        end = start
+        while end < len(names) and names[end].startswith(value):
+            end += 1
+
+        contains = []
+        for position in self.candidates(value, names, postings):
+            index = names[position].find(value, 1)
+            if index > 0 and not start <= position < end:
+                contains.append((index, position))
+        contains.sort()
+
+        return ingredients[start:end] + [
+            ingredients[position] for _, position in contains
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -1,11 +1,37 @@
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import cache
 from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.urls import reverse
 from rest_framework import serializers
 
-from .fields import Base64ImageField, Hex2NameColor
-from .models import Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User
+from .caches import get_version, make_key
+from .carts import change_recipe_in_carts, get_recipe_amounts
+from .fields import Base64ImageField, BulkPrimaryKeyRelatedField, Hex2NameColor
+from .images import get_thumbnail_urls
+from .models import (ExportJob, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCartIngredient, Tag, User)
 from users.models import Subscription
 from users.serializers import UserSerializer
 
+RECIPES_LIMIT = 3
+# Cached recipe fragments include data of tags and ingredients; changes of
+# recipes and their authors increment recipe revision (api.signals).
+FRAGMENT_NAMESPACES = ('tags', 'ingredients')
+
+
+def get_recipes_limit(request):
+    '''Return number of author's recipes to show ("recipes_limit").'''
+    try:
+        return max(
+            int(request.query_params.get('recipes_limit', RECIPES_LIMIT)), 0
+        )
+    except (TypeError, ValueError):
+        return RECIPES_LIMIT
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     '''Serializer for Ingredient nodel objects.'''
@@ -26,9 +52,20 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'color', 'slug')
 
 
+class RecipeIngredientListSerializer(serializers.ListSerializer):
+    '''Ingredients of recipe validated by one query, not a query per item.
+    '''
+    def to_internal_value(self, data):
+        keys = [
+            item.get('id') for item in data if isinstance(item, Mapping)
+        ] if isinstance(data, list) else []
+        with self.child.fields['id'].fetched(keys):
+            return super().to_internal_value(data)
+
+
 class RecipeIngidientSerializer(serializers.Serializer):
     '''Serializer for RecipeIngredient many-to-many objects.'''
-    id = serializers.PrimaryKeyRelatedField(
+    id = BulkPrimaryKeyRelatedField(
         queryset=Ingredient.objects.all(), required=True,
         source='ingredient.id'
     )
@@ -43,10 +80,27 @@ class RecipeIngidientSerializer(serializers.Serializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
+        list_serializer_class = RecipeIngredientListSerializer
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    '''List of recipes assembled from cached fragments (see RecipeSerializer).
+    '''
+    def to_representation(self, data):
+        recipes = list(
+            data.all() if isinstance(data, models.Manager) else data
+        )
+        return self.child.represent(recipes)
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    '''Serializer for RecipeViewSet.'''
+    '''Serializer for RecipeViewSet.
+
+    User independent part of recipe representation (fragment) is cached by
+    recipe revision. Only is_favorited, is_in_shopping_cart and
+    author.is_subscribed are calculated for the request user (RecipeViewSet
+    annotates recipes with them).
+    '''
     author = UserSerializer(many=False, read_only=True)
     image = Base64ImageField(required=False,)
     cooking_time = serializers.IntegerField(
@@ -54,10 +108,11 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    thumbnails = serializers.SerializerMethodField(read_only=True)
     ingredients = RecipeIngidientSerializer(
         required=True, many=True, source='recipeingredient_set'
     )
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = BulkPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
 
@@ -67,6 +122,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             'id',
             'author',
             'image',
+            'thumbnails',
             'name',
             'text',
             'ingredients',
@@ -75,29 +131,54 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'tags'
         )
+        list_serializer_class = RecipeListSerializer
 
     def get_is_favorited(self, obj):
-        '''Return True if recipe is in request user's favorite.'''
+        '''Return True if recipe is in request user's favorite.
+
+        RecipeViewSet annotates the queryset with the flag, so the list is
+        served without a query per recipe. Not annotated instances (e.g. the
+        freshly created one) fall back to a single EXISTS query.
+        '''
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if (
             'request' in self.context
             and self.context['request'].user.is_authenticated
         ):
-            return obj in Recipe.objects.filter(
-                favorites__user=self.context['request'].user
-            )
+            return obj.favorites.filter(
+                user=self.context['request'].user
+            ).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
-        '''Return True if recipe is in request user's shopping cart.'''
+        '''Return True if recipe is in request user's shopping cart.
+
+        Reads RecipeViewSet annotation, see get_is_favorited.
+        '''
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if (
             'request' in self.context
             and self.context['request'].user.is_authenticated
         ):
-            return obj in Recipe.objects.filter(
-                in_shopping_cart__user=self.context['request'].user
-            )
+            return obj.in_shopping_cart.filter(
+                user=self.context['request'].user
+            ).exists()
         return False
 
+    def get_thumbnails(self, obj):
+        '''Return URLs of image thumbnails by size name (api.images).'''
+        return get_thumbnail_urls(obj, self.context.get('request'))
+
+    def get_is_subscribed(self, obj):
+        '''Return True if request user is subscribed to author of recipe.'''
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return UserSerializer(context=self.context).get_is_subscribed(
+            obj.author
+        )
+
     def validate_tags(self, value):
         if len(value) == 0:
             raise serializers.ValidationError('At least one tag required!')
@@ -131,6 +212,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             RecipeTag(tag=tag, recipe=instance) for tag in tags
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         # only unique tags available.
         tags = set(validated_data.pop('tags'))
@@ -147,6 +229,7 @@ class RecipeSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         tags = set(validated_data.pop('tags'))
         ingredients = validated_data.pop('recipeingredient_set')
@@ -155,14 +238,102 @@ class RecipeSerializer(serializers.ModelSerializer):
             dataset[
                 ingredient['ingredient']['id']
             ] = ingredient['amount']
+        old_amounts = get_recipe_amounts(instance.pk)
         RecipeIngredient.objects.filter(recipe=instance).delete()
         RecipeTag.objects.filter(recipe=instance).delete()
         self.recipe_tags_ingredients(dataset, instance, tags)
-
-        super().update(instance, validated_data)
+        change_recipe_in_carts(instance.pk, old_amounts, {
+            ingredient.pk: amount for ingredient, amount in dataset.items()
+        })
+
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        # Only the edited fields: counters, revision and has_thumbnails are
+        # updated concurrently by F() expressions (signals, thumbnails).
+        update_fields = list(validated_data)
+        if 'image' in validated_data:
+            # Reset by process_recipe_image for the new image.
+            update_fields.append('has_thumbnails')
+        instance.save(update_fields=update_fields)
         return instance
 
     def to_representation(self, instance):
+        return self.represent([instance])[0]
+
+    def represent(self, recipes):
+        '''Return representations of recipes: fragments and user's flags.'''
+        flags = {
+            recipe.pk: (
+                self.get_is_favorited(recipe),
+                self.get_is_in_shopping_cart(recipe),
+                self.get_is_subscribed(recipe),
+            ) for recipe in recipes
+        }
+        fragments = self.get_fragments(recipes, flags)
+        representations = []
+        for recipe in recipes:
+            is_favorited, is_in_shopping_cart, is_subscribed = flags[
+                recipe.pk
+            ]
+            representation = fragments[recipe.pk].copy()
+            representation['author'] = {
+                **representation['author'], 'is_subscribed': is_subscribed
+            }
+            representation['is_favorited'] = is_favorited
+            representation['is_in_shopping_cart'] = is_in_shopping_cart
+            representations.append(representation)
+        return representations
+
+    def get_fragments(self, recipes, flags):
+        '''Return {recipe id: fragment}.
+
+        Fragments are read from cache by one multi-get; missed ones are
+        serialized, related objects are prefetched for them only.
+        '''
+        version = '-'.join(
+            str(get_version(namespace)) for namespace in FRAGMENT_NAMESPACES
+        )
+        # Image URLs are absolute, so fragments depend on the host.
+        host = (
+            self.context['request'].get_host()
+            if 'request' in self.context else ''
+        )
+        keys = {
+            recipe.pk: make_key(
+                'recipe', version, host, recipe.pk, recipe.revision
+            ) for recipe in recipes
+        }
+        fragments = cache.get_many(keys.values())
+        missed = [
+            recipe for recipe in recipes if keys[recipe.pk] not in fragments
+        ]
+        if missed:
+            prefetch_related_objects(
+                missed,
+                'author',
+                Prefetch(
+                    'recipeingredient_set',
+                    queryset=RecipeIngredient.objects.select_related(
+                        'ingredient'
+                    )
+                ),
+                'tags',
+            )
+            serialized = {}
+            for recipe in missed:
+                # Flags are known already, serializer should not query them
+                # (they are replaced with flags of the request user anyway).
+                (
+                    recipe.is_favorited,
+                    recipe.is_in_shopping_cart,
+                    recipe.author.is_subscribed
+                ) = flags[recipe.pk]
+                serialized[keys[recipe.pk]] = self.serialize(recipe)
+            cache.set_many(serialized, settings.RECIPE_CACHE_TIMEOUT)
+            fragments.update(serialized)
+        return {pk: fragments[key] for pk, key in keys.items()}
+
+    def serialize(self, instance):
         '''Need this for tags field only.
 
         When creating/updating, provide list of int (as Tag pk). When
@@ -181,7 +352,11 @@ class NestedRecipeSerializer(RecipeSerializer):
     '''Shortened RecipeSerializer (limited fields as required by redoc).'''
     class Meta:
         model = Recipe
-        fields = ('id', 'image', 'name', 'cooking_time',)
+        fields = ('id', 'image', 'thumbnails', 'name', 'cooking_time',)
+
+    def to_representation(self, instance):
+        '''Skip tags added by RecipeSerializer (not in RecipeMinified).'''
+        return serializers.ModelSerializer.to_representation(self, instance)
 
 
 class UserSubscribedSerializer(UserSerializer):
@@ -207,8 +382,8 @@ class UserSubscribedSerializer(UserSerializer):
         )
 
     def get_recipes_count(self, obj):
-        '''Return total number of author's recipes.'''
-        return obj.recipes.count()
+        '''Return total number of author's recipes (denormalized counter).'''
+        return obj.recipes_count
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
@@ -238,14 +413,47 @@ class SubscriptionSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes(self, obj):
-        '''Return recipes serializers, total number is limited.'''
-        try:
-            limit = int(self.context['request'].query_params['recipes_limit'])
-        except Exception:
-            limit = 3
-        return NestedRecipeSerializer(
-            obj.following.recipes.all()[:limit], many=True
-        ).data
+        '''Return recipes serializers, total number is limited.
+
+        SubscriptionListViewSet fetches latest recipes of all authors on the
+        page in one query (latest_recipes attribute of the author).
+        '''
+        recipes = getattr(obj.following, 'latest_recipes', None)
+        if recipes is None:
+            recipes = obj.following.recipes.all()[
+                :get_recipes_limit(self.context['request'])
+            ]
+        return NestedRecipeSerializer(recipes, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.following.recipes.count()
+        return obj.following.recipes_count
+
+
+class ShoppingCartIngredientSerializer(serializers.ModelSerializer):
+    '''Serializer for total amount of ingredient in the shopping cart.'''
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingCartIngredient
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class ExportJobSerializer(serializers.ModelSerializer):
+    '''Serializer for shopping list export jobs.'''
+    type = serializers.ReadOnlyField(source='file_format')
+    url = serializers.SerializerMethodField(read_only=True)
+
+    class Meta:
+        model = ExportJob
+        fields = ('id', 'type', 'status', 'error', 'created', 'url')
+
+    def get_url(self, obj):
+        '''Return URL to poll the job status and download the file.'''
+        url = reverse('api:shopping_cart_export', args=(obj.id,))
+        if 'request' in self.context:
+            return self.context['request'].build_absolute_uri(url)
+        return url
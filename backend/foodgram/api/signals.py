@@ -0,0 +1,190 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from .caches import invalidate, invalidate_on_commit, on_commit_once
+from .carts import change_cart_totals, get_recipe_amounts
+from .images import process_image, submit_thumbnails
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+                     ShoppingCart, Tag)
+from users.models import User
+
+# User fields shown in recipes (author).
+AUTHOR_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    '''Invalidate cached tag catalog and recipes on every change of Tag.'''
+    invalidate_on_commit('tags', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    '''Invalidate cached ingredient catalog and recipes on every change.'''
+    invalidate_on_commit('ingredients', 'recipes')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def invalidate_recipe(sender, instance, **kwargs):
+    '''Invalidate cached recipe pages and the recipe itself.'''
+    invalidate_on_commit('recipes', f'recipes-{instance.pk}')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver((post_save, post_delete), sender=RecipeTag)
+def invalidate_recipes(sender, instance, **kwargs):
+    '''Invalidate cached data built from ingredients and tags of recipes.'''
+    invalidate_on_commit('recipes', f'recipes-{instance.recipe_id}')
+    increment_revision_on_commit(instance.recipe_id)
+
+
+def increment_revision_on_commit(recipe_id):
+    '''Increment revision of the recipe once per transaction, on commit.
+
+    Once per recipe, not per saved row: updates replace all rows of the
+    recipe. On commit: until then other transactions read the old data, so
+    fragments they cache under the old revision are still valid.
+    '''
+    on_commit_once(
+        ('revision', recipe_id),
+        lambda: Recipe.objects.filter(pk=recipe_id).update(
+            revision=F('revision') + 1
+        )
+    )
+
+
+def get_changed_fields(instance, fields, update_fields=None):
+    '''Return those of fields of the saved user changed since loaded.
+
+    Saved values are remembered by User.from_db; users not loaded from
+    the database have all fields changed.
+    '''
+    if update_fields is not None:
+        fields = [field for field in fields if field in update_fields]
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is None:
+        return fields
+    changed = [
+        field for field in fields
+        if field not in loaded or loaded[field] != getattr(instance, field)
+    ]
+    loaded.update((field, getattr(instance, field)) for field in changed)
+    return changed
+
+
+@receiver(post_save, sender=User)
+def invalidate_author(sender, instance, created, update_fields=None,
+                      **kwargs):
+    '''Invalidate cached recipes of the author if shown fields changed.
+
+    Signup, login, password, role and counters change nothing shown.
+    '''
+    if created or not get_changed_fields(
+        instance, AUTHOR_FIELDS, update_fields
+    ):
+        return
+    author_id = instance.pk
+    on_commit_once(
+        ('author', author_id), lambda: invalidate_author_recipes(author_id)
+    )
+
+
+def invalidate_author_recipes(author_id):
+    '''Invalidate cached pages and fragments of recipes of the author.
+
+    List pages are not invalidated: they show new author fields once
+    expired (RECIPE_CACHE_TIMEOUT) or on a change of any recipe.
+    '''
+    recipes = Recipe.objects.filter(author_id=author_id)
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    if recipe_ids:
+        recipes.update(revision=F('revision') + 1)
+        invalidate(*(f'recipes-{recipe_id}' for recipe_id in recipe_ids))
+
+
+@receiver(post_save, sender=Favorite)
+def increment_favorites_count(sender, instance, created, **kwargs):
+    '''Increment favorites counter of the recipe.'''
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrement_favorites_count(sender, instance, **kwargs):
+    '''Decrement favorites counter of the recipe.'''
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_cart_totals(sender, instance, created, **kwargs):
+    '''Add ingredients of the recipe to totals of the shopping cart.'''
+    if created:
+        change_cart_totals(
+            [instance.user_id], get_recipe_amounts(instance.recipe_id)
+        )
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def subtract_from_cart_totals(sender, instance, **kwargs):
+    '''Subtract ingredients of the recipe from totals of the shopping cart.
+
+    pre_delete: when the recipe itself is deleted, its ingredients are
+    detached (SET_NULL) before post_delete of the cart is sent.
+    '''
+    change_cart_totals([instance.user_id], {
+        pk: -amount
+        for pk, amount in get_recipe_amounts(instance.recipe_id).items()
+    })
+
+
+@receiver(post_save, sender=Recipe)
+def increment_recipes_count(sender, instance, created, **kwargs):
+    '''Increment recipes counter of the author.'''
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(pre_save, sender=Recipe)
+def process_recipe_image(sender, instance, raw=False, **kwargs):
+    '''Re-encode newly uploaded image (not saved to storage yet).
+
+    In the request, not by the worker pool: the original with metadata
+    (e.g. EXIF location) is never stored or served by an immutable URL.
+    '''
+    if raw or not instance.image or instance.image._committed:
+        return
+    instance.image = process_image(instance.image)
+    instance.has_thumbnails = False
+    instance._image_uploaded = True
+
+
+@receiver(post_save, sender=Recipe)
+def queue_thumbnails(sender, instance, **kwargs):
+    '''Generate thumbnails of newly uploaded image in background.'''
+    if getattr(instance, '_image_uploaded', False):
+        del instance._image_uploaded
+        submit_thumbnails(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def increment_revision(sender, instance, created, **kwargs):
+    '''Increment revision of the updated recipe (see RecipeSerializer).'''
+    if not created:
+        increment_revision_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def decrement_recipes_count(sender, instance, **kwargs):
+    '''Decrement recipes counter of the author.'''
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=Greatest(F('recipes_count') - 1, 0)
+    )
@@ -0,0 +1,41 @@
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''File system storage for files named by hash of their content.
+
+    The same name always means the same content, so an existing file is
+    reused instead of being written again (deduplication) and names never
+    get random suffixes. Files are written to a temporary file and renamed,
+    so concurrent uploads of the same content are safe.
+    '''
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        try:
+            # Reused blob is fresh again for garbage collection grace period.
+            os.utime(full_path)
+            return name
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=directory, prefix='.upload-', delete=False
+        ) as file:
+            for chunk in content.chunks():
+                file.write(chunk)
+        os.chmod(file.name, self.file_permissions_mode or 0o644)
+        os.replace(file.name, full_path)
+        return name
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,727 @@
+import base64
+import io
+import os
+import tempfile
+import textwrap
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipIf, skipUnless
+from urllib.parse import urlsplit
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, resolve
+from django.utils import timezone
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase, APITransactionTestCase
+
+from . import urls
+from .benchmarks import (ISOLATED_CACHES, RouteBenchmark, clear_caches,
+                         seed_database)
+from .carts import rebuild_cart_totals
+from .counters import recount_counters
+from .fields import decode_base64_image
+from .jobs import clean_export_jobs
+from .models import (ExportJob, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCart, ShoppingCartIngredient, Tag)
+from .plans import check_plans, find_full_scans
+from .units import aggregate_amounts
+from users.models import User
+
+
+def get_view_names(patterns, namespace=urls.app_name):
+    '''Yield "namespace:name" of named URL patterns, included ones too.'''
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from get_view_names(pattern.url_patterns, namespace)
+        elif pattern.name:
+            yield f'{namespace}:{pattern.name}'
+
+
+def use_media_root(test):
+    '''Save files of the test to a temporary MEDIA_ROOT.'''
+    media = tempfile.TemporaryDirectory()
+    test.addCleanup(media.cleanup)
+    media_root = override_settings(MEDIA_ROOT=media.name)
+    media_root.enable()
+    test.addCleanup(media_root.disable)
+
+
+# Savepoints of TestCase are counted, so budgets are not checked here (see
+# QueryBudgetTest).
+@override_settings(CACHES=ISOLATED_CACHES, SQL_STATS=False)
+class RecipeQueriesTest(APITestCase):
+    '''Query count of recipe endpoints does not depend on the data size.
+
+    Every request is made with cleared caches (the most queries it takes).
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Tag {i}', color=f'#00000{i}', slug=f'tag-{i}'
+            ) for i in range(3)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ingredient {i}', measurement_unit='г'
+            ) for i in range(10)
+        ]
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{i}', email=f'user{i}@foodgram.ru',
+                password='foodgram-password', first_name='First',
+                last_name='Last'
+            ) for i in range(3)
+        ]
+        cls.token = Token.objects.create(user=cls.users[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_recipes(self, number, ingredients=5):
+        for i in range(number):
+            recipe = Recipe.objects.create(
+                author=self.users[i % len(self.users)], name=f'Recipe {i}',
+                text='Text.', cooking_time=10
+            )
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=10
+                ) for ingredient in self.ingredients[:ingredients]
+            ])
+            RecipeTag.objects.bulk_create([
+                RecipeTag(recipe=recipe, tag=tag) for tag in self.tags
+            ])
+        return recipe
+
+    def recipe_data(self, ingredients):
+        return {
+            'name': 'Recipe',
+            'text': 'Text.',
+            'cooking_time': 10,
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients[:ingredients]
+            ],
+        }
+
+    def assert_queries(self, number, method, path, data=None, client=None,
+                       status=200):
+        clear_caches()
+        with self.assertNumQueries(number):
+            response = getattr(client or self.client, method)(
+                path, data, format='json'
+            )
+        self.assertEqual(response.status_code, status, response.data)
+        return response
+
+    def test_list(self):
+        for recipes in (1, 6):
+            self.create_recipes(recipes)
+            with self.subTest(recipes=recipes):
+                self.assert_queries(
+                    5, 'get', '/api/recipes/', client=APIClient()
+                )
+                self.assert_queries(6, 'get', '/api/recipes/')
+                self.assert_queries(
+                    7, 'get',
+                    f'/api/recipes/?author={self.users[0].id}&tags=tag-0'
+                )
+
+    def test_retrieve(self):
+        for ingredients in (1, 10):
+            recipe = self.create_recipes(1, ingredients)
+            with self.subTest(ingredients=ingredients):
+                self.assert_queries(
+                    4, 'get', f'/api/recipes/{recipe.id}/', client=APIClient()
+                )
+                self.assert_queries(5, 'get', f'/api/recipes/{recipe.id}/')
+
+    def test_create(self):
+        for ingredients in (1, 10):
+            with self.subTest(ingredients=ingredients):
+                self.assert_queries(
+                    14, 'post', '/api/recipes/',
+                    self.recipe_data(ingredients), status=201
+                )
+
+    def test_update(self):
+        recipe = self.create_recipes(1)
+        for ingredients in (1, 10):
+            with self.subTest(ingredients=ingredients):
+                self.assert_queries(
+                    20, 'patch', f'/api/recipes/{recipe.id}/',
+                    self.recipe_data(ingredients)
+                )
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class RecipeIndexesTest(TestCase):
+    '''Recipe list filters are served by indexes (EXPLAIN, api/plans.py).'''
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_database(
+            users=500, recipes=5000, favorites=10, carts=5, subscriptions=5
+        )
+        cls.user = User.objects.get(username='bench0')
+
+    def test_filters_use_indexes(self):
+        for result in check_plans(self.user):
+            with self.subTest(result['name'], query=result['query']):
+                self.assertEqual(result['full_scans'], [], result['plan'])
+
+    def test_find_full_scans(self):
+        for vendor, plan, tables in (
+            ('sqlite', 'SCAN api_recipe', ['api_recipe']),
+            ('sqlite', 'SCAN TABLE api_favorite', ['api_favorite']),
+            ('sqlite', 'SCAN api_recipe USING INDEX recipe_pub_date', []),
+            ('sqlite', 'SCAN api_tag', []),
+            ('postgresql', 'Seq Scan on api_recipetag', ['api_recipetag']),
+            ('postgresql', 'Index Scan using idx on api_recipe', []),
+        ):
+            with self.subTest(vendor=vendor, plan=plan):
+                self.assertEqual(find_full_scans(plan, vendor), tables)
+
+
+@override_settings(CACHES=ISOLATED_CACHES, SQL_STRICT=True)
+class QueryBudgetTest(TransactionTestCase):
+    '''Every API route keeps to its query budget and repeats no query.
+
+    Routes of the benchmark with cold and warm caches (SQL_STRICT raises
+    QueryBudgetError); the benchmark has to measure every named route of
+    api/urls.py. Transactions are real: budgets do not count savepoints
+    of TestCase.
+    '''
+
+    def setUp(self):
+        use_media_root(self)
+
+    def test_routes(self):
+        seed_database(
+            users=50, recipes=200, favorites=5, carts=3, subscriptions=5
+        )
+        results = RouteBenchmark(
+            User.objects.get(username='bench0'), iterations=1, warmup=0
+        ).run()
+        for result in results:
+            self.assertLess(result['status'], 400, result)
+        measured = {
+            resolve(urlsplit(result['path']).path).view_name
+            for result in results
+        }
+        # Every named route of the API is measured.
+        self.assertEqual(
+            set(get_view_names(urls.urlpatterns)) - measured, set()
+        )
+
+
+@override_settings(CACHES=ISOLATED_CACHES, SQL_STATS=False)
+class RecipeFragmentsTest(APITransactionTestCase):
+    '''Cached recipe fragments are refreshed by changes of their author only.
+
+    Transactions are real: revisions are incremented on commit.
+    '''
+
+    def setUp(self):
+        clear_caches()
+        self.author = User.objects.create_user(
+            username='author', email='author@foodgram.ru',
+            password='foodgram-password', first_name='First',
+            last_name='Last'
+        )
+        Recipe.objects.create(
+            author=self.author, name='Recipe', text='Text.', cooking_time=10
+        )
+        self.client.force_authenticate(self.author)
+
+    def get_recipes(self):
+        '''Return (queries, author of the recipe) of the recipe list.'''
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data['results'][0]['author']
+
+    def test_signup(self):
+        self.get_recipes()
+        cached, _ = self.get_recipes()
+        response = APIClient().post('/api/users/', {
+            'username': 'user', 'email': 'user@foodgram.ru',
+            'password': 'foodgram-password', 'first_name': 'First',
+            'last_name': 'Last',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.get_recipes()[0], cached)
+
+    def test_author_renamed(self):
+        self.get_recipes()
+        cached, _ = self.get_recipes()
+        self.author.first_name = 'Renamed'
+        self.author.save()
+        queries, author = self.get_recipes()
+        self.assertGreater(queries, cached)
+        self.assertEqual(author['first_name'], 'Renamed')
+
+
+class Base64ImageTest(SimpleTestCase):
+    '''Decoding of base64 data URLs by chunks (api.fields).'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Noise does not compress: the image is larger than a chunk.
+        image = Image.frombytes('RGB', (200, 200), os.urandom(200 * 200 * 3))
+        file = io.BytesIO()
+        image.save(file, 'PNG')
+        cls.image = file.getvalue()
+        cls.encoded = base64.b64encode(cls.image).decode()
+
+    def decode(self, encoded):
+        with decode_base64_image('data:image/png;base64,' + encoded) as file:
+            return file.read()
+
+    def test_decode(self):
+        self.assertEqual(self.decode(self.encoded), self.image)
+
+    def test_line_wrapping(self):
+        for separator in ('\n', '\r\n', ' '):
+            for width in (76, 64 * 1024 - 1):
+                with self.subTest(separator=separator, width=width):
+                    encoded = separator.join(
+                        textwrap.wrap(self.encoded, width)
+                    )
+                    self.assertEqual(self.decode(encoded), self.image)
+
+    def test_invalid(self):
+        for encoded in (self.encoded[:-1], self.encoded + '*', ''):
+            with self.subTest(encoded=encoded[-10:]):
+                with self.assertRaises(serializers.ValidationError):
+                    self.decode(encoded)
+
+    def test_too_large(self):
+        with self.settings(IMAGE_MAX_UPLOAD_SIZE=len(self.image) - 1):
+            with self.assertRaisesMessage(
+                serializers.ValidationError, 'too large'
+            ):
+                self.decode(self.encoded)
+
+
+@override_settings(
+    CACHES=ISOLATED_CACHES, EXPORT_JOB_TIMEOUT=60, EXPORT_JOB_TTL=60 * 60
+)
+class ExportJobCleanupTest(APITestCase):
+    '''Interrupted export jobs fail, expired jobs and files are deleted.'''
+
+    def setUp(self):
+        use_media_root(self)
+        self.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru',
+            password='foodgram-password', first_name='First',
+            last_name='Last'
+        )
+
+    def create_job(self, age, status, file=False):
+        job = ExportJob.objects.create(
+            user=self.user, file_format='txt', status=status
+        )
+        if file:
+            job.file.save('shopping_list.txt', ContentFile(b'list'))
+        ExportJob.objects.filter(pk=job.pk).update(
+            created=timezone.now() - timedelta(seconds=age)
+        )
+        job.refresh_from_db()
+        return job
+
+    def create_file(self, age):
+        name = default_storage.save('exports/unused.txt', ContentFile(b'x'))
+        modified = time.time() - age
+        os.utime(default_storage.path(name), (modified, modified))
+        return name
+
+    def test_clean(self):
+        interrupted = self.create_job(120, ExportJob.RUNNING)
+        running = self.create_job(10, ExportJob.RUNNING)
+        expired = self.create_job(2 * 60 * 60, ExportJob.DONE, file=True)
+        done = self.create_job(10, ExportJob.DONE, file=True)
+        unused = self.create_file(2 * 60 * 60)
+        recent = self.create_file(10)
+
+        self.assertEqual(clean_export_jobs(), (1, 1, 2))
+
+        statuses = dict(ExportJob.objects.values_list('pk', 'status'))
+        self.assertEqual(statuses, {
+            interrupted.pk: ExportJob.FAILED,
+            running.pk: ExportJob.RUNNING,
+            done.pk: ExportJob.DONE,
+        })
+        for name, exists in (
+            (expired.file.name, False), (unused, False),
+            (done.file.name, True), (recent, True),
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(default_storage.exists(name), exists)
+
+    def test_stale_job_status(self):
+        job = self.create_job(120, ExportJob.PENDING)
+        self.client.force_authenticate(self.user)
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/{job.pk}/'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['status'], ExportJob.FAILED)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ExportJob.FAILED)
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class ExportJobTest(APITransactionTestCase):
+    '''Shopping list is exported by the worker pool and polled by its owner.
+
+    Transactions are real: jobs are queued on commit.
+    '''
+
+    def setUp(self):
+        use_media_root(self)
+        self.user, self.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='foodgram-password', first_name='First',
+                last_name='Last'
+            ) for name in ('user', 'other')
+        )
+        recipe = Recipe.objects.create(
+            author=self.user, name='Recipe', text='Text.', cooking_time=10
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe, amount=10, ingredient=Ingredient.objects.create(
+                name='Sugar', measurement_unit='г'
+            )
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def poll(self, url, timeout=30):
+        '''Return response to url once the job is not running.'''
+        deadline = time.monotonic() + timeout
+        response = self.client.get(url)
+        while response.status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.05)
+            response = self.client.get(url)
+        return response
+
+    def test_export(self):
+        self.client.force_authenticate(self.user)
+        response = self.client.post(
+            '/api/recipes/download_shopping_cart/?type=txt'
+        )
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], ExportJob.PENDING)
+        url = response.data['url']
+
+        response = self.poll(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'attachment; filename="List.txt"',
+            response['Content-Disposition']
+        )
+        self.assertTrue(
+            b''.join(response.streaming_content).startswith(
+                'Sugar (г) - 10\n'.encode('utf-8')
+            )
+        )
+        response.close()
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(CACHES=ISOLATED_CACHES, SQL_STATS=False)
+class CountersTest(APITestCase):
+    '''Counters updated by signals are equal to counters recounted.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.user, cls.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='foodgram-password', first_name='First',
+                last_name='Last'
+            ) for name in ('author', 'user', 'other')
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name='Recipe', text='Text.', cooking_time=10
+            ) for author in (cls.author, cls.author, cls.other)
+        ]
+
+    def get_counters(self):
+        return (
+            set(Recipe.objects.values_list('pk', 'favorites_count')),
+            set(User.objects.values_list(
+                'pk', 'recipes_count', 'followers_count'
+            )),
+        )
+
+    def assert_counters(self):
+        counters = self.get_counters()
+        recount_counters()
+        self.assertEqual(counters, self.get_counters())
+
+    def request(self, user, method, path):
+        self.client.force_authenticate(user)
+        response = getattr(self.client, method)(path)
+        self.assertEqual(response.status_code, 204)
+
+    def favorite(self, user, recipe, method='post'):
+        self.request(user, method, f'/api/recipes/{recipe.id}/favorite/')
+
+    def subscribe(self, user, author, method='post'):
+        self.request(user, method, f'/api/users/{author.id}/subscribe/')
+
+    def test_counters(self):
+        first, second, third = self.recipes
+        for user, recipe in (
+            (self.user, first), (self.other, first), (self.other, second),
+            (self.author, third),
+        ):
+            self.favorite(user, recipe)
+        for user, author in (
+            (self.user, self.author), (self.other, self.author),
+            (self.user, self.other),
+        ):
+            self.subscribe(user, author)
+        self.assert_counters()
+
+        self.favorite(self.other, second, 'delete')
+        self.subscribe(self.user, self.other, 'delete')
+        self.assert_counters()
+
+        # Cascade: favorites of the recipe, the user with recipe,
+        # favorites and subscription.
+        self.request(self.author, 'delete', f'/api/recipes/{first.id}/')
+        self.other.delete()
+        self.assert_counters()
+
+    def test_clamping(self):
+        recipe = self.recipes[0]
+        self.favorite(self.user, recipe)
+        self.subscribe(self.user, self.author)
+        # Counters are wrong (e.g. changed by bulk operations).
+        Recipe.objects.update(favorites_count=0)
+        User.objects.update(recipes_count=0, followers_count=0)
+
+        self.favorite(self.user, recipe, 'delete')
+        self.subscribe(self.user, self.author, 'delete')
+        self.request(self.author, 'delete', f'/api/recipes/{recipe.id}/')
+
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).followers_count, 0
+        )
+        self.assertFalse(User.objects.filter(recipes_count__gt=0).exists())
+        self.assertFalse(
+            Recipe.objects.filter(favorites_count__gt=0).exists()
+        )
+
+
+@override_settings(CACHES=ISOLATED_CACHES, SQL_STATS=False)
+class CartTotalsTest(APITestCase):
+    '''Incremental cart totals are equal to totals rebuilt from scratch.'''
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Tag', color='#000000', slug='tag')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ingredient {i}', measurement_unit='г'
+            ) for i in range(4)
+        ]
+        cls.author = User.objects.create_superuser(
+            username='author', email='author@foodgram.ru',
+            password='foodgram-password', first_name='First',
+            last_name='Last'
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru',
+            password='foodgram-password', first_name='First',
+            last_name='Last'
+        )
+        cls.recipes = [
+            cls.create_recipe(amounts) for amounts in ((10, 20), (0, 5, 7))
+        ]
+
+    @classmethod
+    def create_recipe(cls, amounts):
+        # The image is stored already: it is not processed.
+        recipe = Recipe.objects.create(
+            author=cls.author, name='Recipe', text='Text.', cooking_time=10,
+            image='recipes/images/recipe.png'
+        )
+        RecipeTag.objects.create(recipe=recipe, tag=cls.tag)
+        for ingredient, amount in zip(cls.ingredients, amounts):
+            if amount:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=amount
+                )
+        return recipe
+
+    def assert_totals(self):
+        totals = set(ShoppingCartIngredient.objects.values_list(
+            'user_id', 'ingredient_id', 'amount'
+        ))
+        rebuild_cart_totals()
+        self.assertEqual(totals, set(
+            ShoppingCartIngredient.objects.values_list(
+                'user_id', 'ingredient_id', 'amount'
+            )
+        ))
+
+    def request(self, user, method, path, data=None, status=200):
+        self.client.force_authenticate(user)
+        response = getattr(self.client, method)(path, data, format='json')
+        self.assertEqual(response.status_code, status)
+
+    def admin_data(self, recipe, amounts):
+        '''Return change form data of the recipe with new amounts.'''
+        rows = list(recipe.recipeingredient_set.order_by('ingredient_id'))
+        data = {
+            'author': recipe.author_id, 'name': recipe.name,
+            'text': recipe.text, 'cooking_time': recipe.cooking_time,
+            'recipetag_set-TOTAL_FORMS': 0,
+            'recipetag_set-INITIAL_FORMS': 0,
+            'recipeingredient_set-TOTAL_FORMS': len(amounts),
+            'recipeingredient_set-INITIAL_FORMS': len(rows),
+        }
+        for number, (ingredient, amount) in enumerate(
+            zip(self.ingredients, amounts)
+        ):
+            prefix = f'recipeingredient_set-{number}-'
+            if number < len(rows):
+                data[prefix + 'id'] = rows[number].pk
+            data[prefix + 'recipe'] = recipe.pk
+            data[prefix + 'ingredient'] = ingredient.pk
+            data[prefix + 'amount'] = amount
+        return data
+
+    def test_totals(self):
+        first, second = self.recipes
+        for user, recipe in (
+            (self.user, first), (self.user, second), (self.author, second)
+        ):
+            self.request(
+                user, 'post', f'/api/recipes/{recipe.id}/shopping_cart/',
+                status=204
+            )
+        self.assert_totals()
+
+        self.request(self.author, 'patch', f'/api/recipes/{second.id}/', {
+            'name': 'Recipe', 'text': 'Text.', 'cooking_time': 10,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': self.ingredients[0].id, 'amount': 3},
+                {'id': self.ingredients[1].id, 'amount': 6},
+            ],
+        })
+        self.assert_totals()
+
+        self.client.force_login(self.author)
+        response = self.client.post(
+            f'/admin/api/recipe/{first.id}/change/',
+            self.admin_data(first, (1, 2, 3))
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            ShoppingCartIngredient.objects.filter(user=self.user).count(), 3
+        )
+        self.assert_totals()
+
+        self.request(
+            self.user, 'delete', f'/api/recipes/{first.id}/shopping_cart/',
+            status=204
+        )
+        self.assert_totals()
+
+        self.request(
+            self.author, 'delete', f'/api/recipes/{second.id}/', status=204
+        )
+        self.assert_totals()
+        self.assertFalse(ShoppingCartIngredient.objects.exists())
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class DatabasePoolStatsTest(APITestCase):
+    '''Metrics of database connection pools are shown to staff only.'''
+
+    pooled = connection.settings_dict['ENGINE'] == 'foodgram.dbpool'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.staff = (
+            User.objects.create_user(
+                username=name, email=f'{name}@foodgram.ru',
+                password='foodgram-password', is_staff=is_staff
+            ) for name, is_staff in (('user', False), ('staff', True))
+        )
+
+    def get_stats(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get('/api/metrics/db_pool/')
+
+    def test_not_staff(self):
+        self.assertEqual(self.get_stats(self.user).status_code, 403)
+
+    @skipIf(pooled, 'The database connection is pooled.')
+    def test_not_pooled(self):
+        response = self.get_stats(self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {})
+
+    @skipUnless(pooled, 'The database connection is not pooled.')
+    def test_pooled(self):
+        response = self.get_stats(self.staff)
+        self.assertEqual(response.status_code, 200)
+        # The connection of the test transaction is in use.
+        self.assertTrue(any(
+            stats['in_use'] >= 1 for stats in response.data.values()
+        ))
+
+
+class UnitsTest(SimpleTestCase):
+    '''Amounts in compatible units are summed up (api.units).'''
+
+    def test_aggregate_amounts(self):
+        shopping_list = aggregate_amounts([
+            ('сахар', 'г', 500), ('сахар', 'кг', 1),
+            ('молоко', 'л', 1), ('молоко', 'мл', 250),
+            ('масло', 'ст. л.', 1), ('масло', 'ч. л.', 3),
+            ('уксус', 'Ч.  л.', 4), ('уксус', 'ст. л.', 1),
+            ('перец', 'по вкусу', 1), ('перец', 'по вкусу', 2),
+            ('мука', 'стакан', 1), ('мука', 'г', 100),
+        ])
+        self.assertEqual(
+            [
+                (
+                    item['ingredient__name'],
+                    item['ingredient__measurement_unit'],
+                    item['amount'],
+                ) for item in shopping_list
+            ],
+            [
+                ('масло', 'ст. л.', 2),
+                ('молоко', 'л', Decimal('1.25')),
+                ('мука', 'г', 100),
+                ('мука', 'стакан', 1),
+                ('перец', 'по вкусу', None),
+                ('сахар', 'кг', Decimal('1.5')),
+                ('уксус', 'ч. л.', 7),
+            ]
+        )
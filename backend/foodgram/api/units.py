@@ -0,0 +1,82 @@
+'''Measurement units: normalization and unit-aware shopping list.
+
+Amounts of the same product in compatible units (г and кг, мл and л,
+ч. л. and ст. л.) are summed up in the base unit and shown in the larger
+unit when the total is big enough and is a whole number of larger units
+or a decimal fraction of one (1.5 кг, but 5 ч. л., not 1.67 ст. л.). Units
+without quantity ("по вкусу") are listed once without amount.
+
+Spoons are not converted to мл or г (weight of a spoon depends on the
+product), other units (шт., стакан, щепотка, ...) are summed up as they
+are: amounts of the same product in such units are listed separately.
+'''
+from decimal import Decimal
+
+# Compatible units found in data/ingredients.csv: unit - (base, factor).
+CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('ч. л.', 1),
+    'ст. л.': ('ч. л.', 3),
+}
+# Larger unit for big totals in the base unit: base - (unit, factor).
+DISPLAY_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+    'ч. л.': ('ст. л.', 3),
+}
+UNQUANTIFIED_UNITS = {'по вкусу'}
+
+
+def normalize_unit(unit):
+    '''Return unit in lower case with single spaces.'''
+    return ' '.join(unit.lower().split())
+
+
+def to_base(amount, unit):
+    '''Return (amount, unit) converted to the base unit.'''
+    unit = normalize_unit(unit)
+    base, factor = CONVERSIONS.get(unit, (unit, 1))
+    return amount * factor, base
+
+
+def to_display(amount, base):
+    '''Return (amount, unit) in the largest unit not exceeding amount.
+
+    The larger unit is used only if the amount is exact in it.
+    '''
+    unit, factor = DISPLAY_UNITS.get(base, (base, 1))
+    if amount >= factor > 1:
+        converted = Decimal(amount) / factor
+        if converted * factor == amount:
+            return converted, unit
+    return amount, base
+
+
+def aggregate_amounts(rows):
+    '''Sum up (name, unit, amount) rows by product and compatible unit.
+
+    One pass over rows (may be a lazy iterator), then one pass over the
+    distinct products. Return list of dicts with keys "ingredient__name",
+    "ingredient__measurement_unit" and "amount" (None for unquantified
+    units) ordered by name and unit.
+    '''
+    totals = {}
+    for name, unit, amount in rows:
+        amount, base = to_base(amount, unit)
+        key = (name.strip(), base)
+        totals[key] = totals.get(key, 0) + amount
+    shopping_list = []
+    for (name, base), amount in sorted(totals.items()):
+        if base in UNQUANTIFIED_UNITS:
+            amount, unit = None, base
+        else:
+            amount, unit = to_display(amount, base)
+        shopping_list.append({
+            'ingredient__name': name,
+            'ingredient__measurement_unit': unit,
+            'amount': amount,
+        })
+    return shopping_list
@@ -1,13 +1,24 @@
+from django.conf import settings
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .asyncviews import make_async_patterns
 from .views import (IngredientViewSet, RecipeViewSet, SubscriptionListViewSet,
-                    TagViewSet, download_shopping_cart, recipe_favorite,
-                    shopping_cart, user_subscribe)
+                    TagViewSet, database_pool_stats, download_shopping_cart,
+                    recipe_favorite, shopping_cart, shopping_cart_export,
+                    shopping_cart_totals, user_subscribe)
 from users.views import UserResetPasswordViewSet, UserViewSet
 
 app_name = 'api'
 
+# Read-heavy routes served by async views under ASGI (api/asyncviews.py).
+ASYNC_ROUTES = (
+    'tags-list', 'tags-detail',
+    'ingredients-list', 'ingredients-detail',
+    'recipes-list', 'recipes-detail',
+    'subscriptions-list',
+)
+
 v1_router = DefaultRouter()
 v1_router.register(
     'users/subscriptions', SubscriptionListViewSet, basename='subscriptions'
@@ -20,6 +31,10 @@ v1_router.register('recipes', RecipeViewSet, basename='recipes')
 v1_router.register('tags', TagViewSet, basename='tags')
 v1_router.register('ingredients', IngredientViewSet, basename='ingredients')
 
+router_urls = v1_router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = make_async_patterns(router_urls, ASYNC_ROUTES)
+
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
@@ -39,5 +54,16 @@ urlpatterns = [
         download_shopping_cart,
         name='download_shopping_cart'
     ),
-    path('', include(v1_router.urls)),
+    path(
+        'recipes/shopping_cart_totals/',
+        shopping_cart_totals,
+        name='shopping_cart_totals'
+    ),
+    path(
+        'recipes/download_shopping_cart/<uuid:job_id>/',
+        shopping_cart_export,
+        name='shopping_cart_export'
+    ),
+    path('metrics/db_pool/', database_pool_stats, name='database_pool_stats'),
+    path('', include(router_urls)),
 ]
@@ -1,10 +1,7 @@
-import io
-
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
-from reportlab.lib.units import cm
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.response import Response
 
@@ -12,6 +9,7 @@ from .models import Recipe
 from .serializers import NestedRecipeSerializer
 
 
+@transaction.atomic
 def favorite_shoppingcart_func(request, model, recipe_id):
     '''Common function for favorite and shopping cart view functions.
 
@@ -35,27 +33,31 @@ def favorite_shoppingcart_func(request, model, recipe_id):
     return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
 
 
-def pdf_from_shopping_cart(shopping_cart):
-    '''Prints ingridients from Recipes added to shopping cart to pdf.'''
-    sentence = ''
-    for ingredient in shopping_cart:
-        sentence += '{name} ({measurement_unit}) - {amount}\n'.format(
-            name=ingredient['recipe__recipeingredient__ingredient__name'],
-            measurement_unit=ingredient[
-                'recipe__recipeingredient__ingredient__measurement_unit'
-            ],
-            amount=ingredient['count']
+def get_latest_recipes(author_ids, limit):
+    '''Return dict author id - list of his/her latest recipes (one query).
+
+    Recipes are numbered by ROW_NUMBER() window partitioned by author,
+    only first "limit" recipes of every author are selected.
+    '''
+    latest_recipes = {author_id: [] for author_id in author_ids}
+    if not author_ids or limit <= 0:
+        return latest_recipes
+    ranked = Recipe.objects.filter(author_id__in=author_ids).annotate(
+        row_number=Window(
+            expression=RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('pub_date').desc(), F('id').desc()],
         )
-    sentence += 'Thanks! Your shopping list is created by IP.'
-
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer)
-    pdfmetrics.registerFont(TTFont('FreeSans', './FreeSans.ttf'))
-    c.setFont('FreeSans', 12)
-    textobject = c.beginText(2 * cm, 29.7 * cm - 2 * cm)
-    for line in sentence.splitlines(False):
-        textobject.textLine(line.encode('utf-8'))
-    c.drawText(textobject)
-    c.save()
-    buffer.seek(0)
-    return buffer
+    ).only(
+        'id', 'author_id', 'name', 'image', 'has_thumbnails', 'cooking_time'
+    ).order_by()
+    sql, params = ranked.query.sql_with_params()
+    # Django 3.2 can not filter by window functions, so wrap the query.
+    recipes = Recipe.objects.raw(
+        f'SELECT * FROM ({sql}) ranked WHERE ranked.row_number <= %s '
+        f'ORDER BY ranked.row_number',
+        (*params, limit)
+    )
+    for recipe in recipes:
+        latest_recipes[recipe.author_id].append(recipe)
+    return latest_recipes
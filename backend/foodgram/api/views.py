@@ -1,47 +1,84 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef, Value
 from django.http import FileResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+from .exports import EXPORT_FORMATS, shopping_list_response
 from .filters import IngredientSearchFilter, RecipeFilter
-from .mixins import ListRetrieveViewSet, ListViewSet
-from .models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from .paginations import RecipePagination
+from .jobs import fail_stale_job, submit_export_job
+from .mixins import (AnonymousCacheMixin, CachedCatalogMixin,
+                     CursorPaginationMixin, ListRetrieveViewSet, ListViewSet)
+from .models import ExportJob, Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from .paginations import (RecipeCursorPagination, RecipePagination,
+                          SubscriptionCursorPagination)
 from .permissions import IsAuthorOrReadOnly
-from .serializers import (IngredientSerializer, RecipeSerializer,
+from .search import ingredient_index
+from .serializers import (ExportJobSerializer, IngredientSerializer,
+                          RecipeSerializer, ShoppingCartIngredientSerializer,
                           SubscriptionSerializer, TagSerializer,
-                          UserSubscribedSerializer)
-from .utils import favorite_shoppingcart_func, pdf_from_shopping_cart
+                          UserSubscribedSerializer, get_recipes_limit)
+from .utils import favorite_shoppingcart_func, get_latest_recipes
+from foodgram.querystats import query_budget
 from users.models import Subscription, User
 
 
-class TagViewSet(ListRetrieveViewSet):
+class TagViewSet(CachedCatalogMixin, ListRetrieveViewSet):
     '''ViewSet for Tag model. Only GET requests. Return list or instance.'''
+    cache_namespace = 'tags'
+    query_budget = 2
     queryset = Tag.objects.all()
     permission_classes = (AllowAny, )
     lookup_field = 'id'
     serializer_class = TagSerializer
 
 
-class SubscriptionListViewSet(ListViewSet):
+class SubscriptionListViewSet(CursorPaginationMixin, ListViewSet):
     '''ViewSet for Subscription model. Only GET requests. Return list.'''
     # queryset = Subscription.objects.all()
     permission_classes = (IsAuthenticated,)
     serializer_class = SubscriptionSerializer
     pagination_class = RecipePagination
+    cursor_pagination_class = SubscriptionCursorPagination
+    query_budget = 4
 
     def get_queryset(self):
-        return Subscription.objects.filter(user=self.request.user)
+        return Subscription.objects.filter(
+            user=self.request.user
+        ).select_related('following')
 
+    def paginate_queryset(self, queryset):
+        '''Attach latest recipes to the authors on the page.
 
+        Recipes of all authors are fetched by one query, recipes count is
+        the denormalized counter of the author. The whole page costs
+        three queries: count, subscriptions with authors and recipes.
+        '''
+        page = super().paginate_queryset(queryset)
+        subscriptions = list(queryset) if page is None else page
+        latest_recipes = get_latest_recipes(
+            [subscription.following_id for subscription in subscriptions],
+            get_recipes_limit(self.request)
+        )
+        for subscription in subscriptions:
+            subscription.following.latest_recipes = latest_recipes[
+                subscription.following_id
+            ]
+        return page
+
+
+@query_budget(9)
 @api_view(['DELETE', 'POST'])
 @login_required
+@transaction.atomic
 def user_subscribe(request, user_id):
     '''ViewSet to supscripe (POST) and unsubscribed (DELETE) to author.'''
     if request.method == 'DELETE':
@@ -66,6 +103,7 @@ def user_subscribe(request, user_id):
     return Response(serializer.data, status=status.HTTP_204_NO_CONTENT)
 
 
+@query_budget(7)
 @api_view(['DELETE', 'POST'])
 @login_required
 def recipe_favorite(request, recipe_id):
@@ -73,6 +111,7 @@ def recipe_favorite(request, recipe_id):
     return favorite_shoppingcart_func(request, Favorite, recipe_id)
 
 
+@query_budget(9)
 @api_view(['DELETE', 'POST'])
 @login_required
 def shopping_cart(request, recipe_id):
@@ -80,50 +119,185 @@ def shopping_cart(request, recipe_id):
     return favorite_shoppingcart_func(request, ShoppingCart, recipe_id)
 
 
+@query_budget(2)
 @api_view(['GET'])
 @login_required
-def download_shopping_cart(request):
-    '''Получаем данные из рецептов в корзине.
+def shopping_cart_totals(request):
+    '''Return total amounts of ingredients in the shopping cart (JSON).
 
-    Через related_name обращаемся к модели ShoppingCart, в ней - находим
-    ingredient и amount. С помощью annotate создаем новое значение count,
-    в котором суммируем значения всех amount для одинаковых ингридиентов.
+    Totals are materialized (api.carts): one query reads one row per
+    distinct ingredient, no matter how many recipes are in the cart.
     '''
+    totals = request.user.cart_ingredients.select_related(
+        'ingredient'
+    ).order_by('ingredient__name')
+    return Response(ShoppingCartIngredientSerializer(totals, many=True).data)
+
 
-    if not request.user.shoppingcarts.exists():
+@query_budget(4)
+@api_view(['GET', 'POST'])
+@login_required
+def download_shopping_cart(request):
+    '''Return list of ingredients of recipes in the shopping cart.
+
+    Amounts of identical ingredients are summed up. Format of the file is
+    set by "type" query parameter: pdf (default), txt or csv. Rendered
+    files are cached until the cart or its recipes change (api/exports.py).
+    POST creates background export job (api/jobs.py) instead; the job is
+    polled and its file is downloaded with shopping_cart_export view.
+    '''
+    file_format = request.query_params.get(
+        'type', request.data.get('type', 'pdf')
+    )
+    if file_format not in EXPORT_FORMATS:
+        return Response(
+            {'type': [f'Available types: {", ".join(EXPORT_FORMATS)}.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if request.method == 'POST':
+        if not request.user.shoppingcarts.exists():
+            return Response(
+                'Your shopping list is empty!',
+                status=status.HTTP_204_NO_CONTENT
+            )
+        job = submit_export_job(request.user, file_format)
+        return Response(
+            ExportJobSerializer(job, context={'request': request}).data,
+            status=status.HTTP_202_ACCEPTED
+        )
+    response = shopping_list_response(request.user, file_format)
+    if response is None:
         return Response(
             'Your shopping list is empty!', status=status.HTTP_204_NO_CONTENT
         )
+    return response
+
 
-    shopping_cart = request.user.shoppingcarts.all().values(
-        'recipe__recipeingredient__ingredient__id',
-        'recipe__recipeingredient__ingredient__name',
-        'recipe__recipeingredient__ingredient__measurement_unit'
-    ).order_by(
-        'recipe__recipeingredient__ingredient__name'
-    ).annotate(count=Sum('recipe__recipeingredient__amount'))
-
-    return FileResponse(
-        pdf_from_shopping_cart(shopping_cart),
-        as_attachment=True,
-        filename='List.pdf'
+@query_budget(3)
+@api_view(['GET'])
+@login_required
+def shopping_cart_export(request, job_id):
+    '''Return status of the export job or its file when it is done.
+
+    A job pending or running too long (interrupted) is reported failed.
+    '''
+    job = get_object_or_404(ExportJob, id=job_id, user=request.user)
+    fail_stale_job(job)
+    if job.status == ExportJob.DONE:
+        export_format = EXPORT_FORMATS[job.file_format]
+        return FileResponse(
+            job.file.open('rb'),
+            as_attachment=True,
+            filename=export_format.filename,
+            content_type=export_format.content_type
+        )
+    return Response(
+        ExportJobSerializer(job, context={'request': request}).data,
+        status=(
+            status.HTTP_200_OK if job.status == ExportJob.FAILED
+            else status.HTTP_202_ACCEPTED
+        )
     )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    '''ViewSet for Recipe model objects.'''
+@query_budget(1)
+@api_view(['GET'])
+@permission_classes((IsAdminUser,))
+def database_pool_stats(request):
+    '''Return metrics of database connection pools of the serving process.
+
+    Wait time and saturation (connections in use / max size) of the pools
+    of foodgram.dbpool backend; every worker process has its own pools.
+    '''
+    if not any(
+        connection.settings_dict['ENGINE'] == 'foodgram.dbpool'
+        for connection in connections.all()
+    ):
+        return Response({})
+    # psycopg2 is imported only if the pooled backend is used.
+    from foodgram.dbpool.base import get_pool_stats
+    return Response(get_pool_stats())
+
+
+class RecipeViewSet(
+    AnonymousCacheMixin, CursorPaginationMixin, viewsets.ModelViewSet
+):
+    '''ViewSet for Recipe model objects.
+
+    Pages for anonymous users are cached (see AnonymousCacheMixin and
+    invalidation in api.signals). Recipes are created and updated by JSON
+    (image as base64 data URL) or multipart requests (image as file,
+    ingredients as ingredients[0]id, ingredients[0]amount, ...).
+    '''
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthorOrReadOnly, )
     serializer_class = RecipeSerializer
     lookup_field = 'id'
     filter_backends = (DjangoFilterBackend, )
     pagination_class = RecipePagination
+    cursor_pagination_class = RecipeCursorPagination
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'delete']
+    parser_classes = (JSONParser, MultiPartParser)
+    cache_namespace = 'recipes'
+    cache_detail_namespaces = ('tags', 'ingredients')
+    # Queries per request with cold caches (foodgram/querystats.py); tags
+    # and ingredients are validated by one query each, whatever the number.
+    query_budget = {
+        'list': 7, 'retrieve': 6, 'create': 14, 'partial_update': 19,
+        'destroy': 12,
+    }
 
+    def get_queryset(self):
+        '''Annotate recipes with flags of the request user.
 
-class IngredientViewSet(ListRetrieveViewSet):
+        is_favorited, is_in_shopping_cart and is_subscribed (to the author)
+        are EXISTS subqueries in the same query as the page of recipes.
+        Related objects are prefetched by RecipeSerializer only for recipes
+        missing in the fragment cache.
+        '''
+        return self.annotate_user_flags(super().get_queryset())
+
+    def annotate_user_flags(self, queryset):
+        '''Add is_favorited, is_in_shopping_cart and is_subscribed.'''
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False),
+                is_in_shopping_cart=Value(False),
+                is_subscribed=Value(False),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, following=OuterRef('author_id')
+                )
+            ),
+        )
+
+    def get_planned_instance(self, instance):
+        '''Reload saved recipe through the planned queryset for response.'''
+        return self.get_queryset().get(pk=instance.pk)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        serializer.instance = self.get_planned_instance(serializer.instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        serializer.instance = self.get_planned_instance(serializer.instance)
+
+
+class IngredientViewSet(CachedCatalogMixin, ListRetrieveViewSet):
     '''ViewSet for Ingredient model objects.'''
+    cache_namespace = 'ingredients'
+    query_budget = 3
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny, )
     lookup_field = 'id'
@@ -131,3 +305,18 @@ class IngredientViewSet(ListRetrieveViewSet):
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientSearchFilter
     pagination_class = LimitOffsetPagination
+
+    def filter_queryset(self, queryset):
+        '''Search ingredients by name in the in-process index.
+
+        IngredientSearchFilter (database search) is used when the index is
+        disabled by INGREDIENT_SEARCH_INDEX setting.
+        '''
+        name = self.request.query_params.get('name')
+        if (
+            self.action == 'list'
+            and name
+            and settings.INGREDIENT_SEARCH_INDEX
+        ):
+            return ingredient_index.search(name)
+        return super().filter_queryset(queryset)
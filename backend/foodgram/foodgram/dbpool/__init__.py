@@ -0,0 +1,5 @@
+'''PostgreSQL backend with a process-wide connection pool.
+
+DATABASES ENGINE 'foodgram.dbpool', pool options are the POOL dictionary
+of the database settings (see settings.py and pool.ConnectionPool).
+'''
@@ -0,0 +1,93 @@
+import os
+import threading
+from functools import partial
+
+from django.db.backends.postgresql import base, creation
+
+from .pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool_key(settings_dict):
+    return (
+        settings_dict['HOST'],
+        settings_dict['PORT'],
+        settings_dict['NAME'],
+        settings_dict['USER'],
+        # Replicas may differ by options only (read-only transactions).
+        repr(sorted(settings_dict['OPTIONS'].items())),
+    )
+
+
+def get_pool(settings_dict):
+    '''Return pool of connections to the database, one per process.'''
+    key = get_pool_key(settings_dict)
+    pool = _pools.get(key)
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _pools_lock:
+        pool = _pools.get(key)
+        # Connections of the parent process are not shared after fork.
+        if pool is None or pool.pid != os.getpid():
+            options = {
+                name.lower(): value
+                for name, value in settings_dict.get('POOL', {}).items()
+            }
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+def close_pools(name=None):
+    '''Close pools (of connections to database name) of this process.'''
+    with _pools_lock:
+        keys = [key for key in _pools if name is None or key[2] == name]
+        pools = [_pools.pop(key) for key in keys]
+    for pool in pools:
+        pool.close()
+
+
+def get_pool_stats():
+    '''Return metrics of pools of this process by database name.'''
+    return {
+        '{}@{}'.format(
+            key[2] or 'postgres', key[0] or 'localhost'
+        ): pool.stats()
+        for key, pool in list(_pools.items())
+        if pool.pid == os.getpid()
+    }
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would prevent DROP DATABASE.
+        close_pools(test_database_name)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''PostgreSQL connection checked out from the pool and returned to it.
+
+    Django closes connections as usual (CONN_MAX_AGE, errors), closing
+    returns the connection to the pool.
+    '''
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.settings_dict)
+        connect = partial(super().get_new_connection, conn_params)
+        pool.fill(connect)
+        connection = pool.getconn(connect)
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.settings_dict).putconn(
+                    self.connection, broken=self.errors_occurred
+                )
@@ -0,0 +1,259 @@
+'''Thread-safe pool of psycopg2 connections with metrics.
+
+Connections are checked out by Django connections of any thread (sync
+workers, threads of api.asyncviews) and returned when Django closes them.
+When all max_size connections are in use, checkout waits up to timeout
+seconds for a returned one. A connection is health checked on checkout
+(closed, left in a transaction or idle for check_interval seconds and not
+answering SELECT 1) and recycled after max_lifetime seconds; connections
+above min_size are closed after max_idle seconds without use.
+'''
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    '''No connection was returned to the full pool in time.'''
+
+
+class PooledConnection:
+    '''Connection with the times it was opened and returned to the pool.'''
+    __slots__ = ('connection', 'created', 'returned')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created = self.returned = time.monotonic()
+
+
+class ConnectionPool:
+    '''Pool of connections opened by connect() (see module docstring).'''
+
+    def __init__(self, min_size=1, max_size=20, timeout=10,
+                 max_lifetime=60 * 60, max_idle=5 * 60, check_interval=10):
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size, 1)
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.check_interval = check_interval
+        self.pid = os.getpid()
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.in_use = {}
+        self.size = 0
+        self.counters = {
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'opened': 0,
+            'closed': 0,
+            'broken': 0,
+        }
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.peak_in_use = 0
+
+    def getconn(self, connect):
+        '''Return healthy connection, open it by connect() if needed.
+
+        Raises PoolTimeout if the pool stays full for timeout seconds.
+        '''
+        start = time.monotonic()
+        waited = False
+        while True:
+            with self.condition:
+                pooled = self.reserve(start)
+                if pooled is None:
+                    waited = True
+                    continue
+            if pooled is True:
+                pooled = self.open(connect)
+            elif not self.is_usable(pooled):
+                continue
+            with self.condition:
+                self.in_use[id(pooled.connection)] = pooled
+                self.count_checkout(start, waited)
+            return pooled.connection
+
+    def reserve(self, start):
+        '''Take idle connection or a slot for a new one (True) or wait.
+
+        Called with the condition held, returns None after a wait.
+        '''
+        if self.idle:
+            return self.idle.pop()
+        if self.size < self.max_size:
+            self.size += 1
+            return True
+        remaining = self.timeout - (time.monotonic() - start)
+        if remaining <= 0:
+            self.counters['timeouts'] += 1
+            logger.warning(
+                'Database pool is exhausted: %s connections in use '
+                'for %.1f s.',
+                self.size, self.timeout
+            )
+            raise PoolTimeout(
+                f'No database connection available in {self.timeout} s.'
+            )
+        self.condition.wait(remaining)
+        return None
+
+    def count_checkout(self, start, waited):
+        wait_time = time.monotonic() - start
+        self.counters['checkouts'] += 1
+        self.counters['waits'] += waited
+        self.wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.peak_in_use = max(self.peak_in_use, len(self.in_use))
+
+    def open(self, connect):
+        '''Open connection in the reserved slot, free the slot on error.'''
+        try:
+            connection = connect()
+            # Idle connections are in autocommit mode, so the health check
+            # does not leave a transaction open (Django can not switch
+            # autocommit inside one).
+            connection.autocommit = True
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.counters['opened'] += 1
+        return PooledConnection(connection)
+
+    def is_usable(self, pooled):
+        '''Check idle connection before checkout, close it if unusable.'''
+        if time.monotonic() - pooled.created > self.max_lifetime:
+            self.discard(pooled.connection)
+            return False
+        if not self.is_healthy(pooled):
+            self.discard(pooled.connection, broken=True)
+            return False
+        return True
+
+    def is_healthy(self, pooled):
+        '''Check connection taken from the pool before giving it out.'''
+        connection = pooled.connection
+        if (
+            connection.closed
+            or connection.get_transaction_status()
+            != extensions.TRANSACTION_STATUS_IDLE
+        ):
+            return False
+        if time.monotonic() - pooled.returned < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+        except psycopg2.Error:
+            return False
+        return True
+
+    def putconn(self, connection, broken=False):
+        '''Return connection to the pool; broken or old ones are closed.'''
+        with self.condition:
+            pooled = self.in_use.pop(id(connection), None)
+        if pooled is None:
+            # Opened by another pool (before fork or pools were closed).
+            connection.close()
+            return
+        if (
+            not broken
+            and not connection.closed
+            and time.monotonic() - pooled.created < self.max_lifetime
+        ):
+            try:
+                if (
+                    connection.get_transaction_status()
+                    != extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    connection.rollback()
+                if not connection.autocommit:
+                    connection.autocommit = True
+            except psycopg2.Error:
+                broken = True
+            else:
+                pooled.returned = time.monotonic()
+                with self.condition:
+                    self.idle.append(pooled)
+                    self.condition.notify()
+                self.close_idle()
+                return
+        self.discard(connection, broken)
+
+    def discard(self, connection, broken=False):
+        '''Close connection and free its slot.'''
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+        with self.condition:
+            self.size -= 1
+            self.counters['closed'] += 1
+            self.counters['broken'] += broken
+            self.condition.notify()
+
+    def close_idle(self):
+        '''Close connections above min_size unused for max_idle seconds.'''
+        expired = []
+        with self.condition:
+            now = time.monotonic()
+            while (
+                self.idle
+                and self.size - len(expired) > self.min_size
+                and now - self.idle[0].returned > self.max_idle
+            ):
+                expired.append(self.idle.popleft())
+        for pooled in expired:
+            self.discard(pooled.connection)
+
+    def fill(self, connect):
+        '''Open connections up to min_size.'''
+        while True:
+            with self.condition:
+                if self.size >= self.min_size:
+                    return
+                self.size += 1
+            pooled = self.open(connect)
+            with self.condition:
+                self.idle.append(pooled)
+                self.condition.notify()
+
+    def close(self):
+        '''Close idle connections, connections in use are closed on return.'''
+        with self.condition:
+            idle, self.idle = list(self.idle), deque()
+            self.in_use.clear()
+        for pooled in idle:
+            self.discard(pooled.connection)
+
+    def stats(self):
+        '''Return metrics of the pool.'''
+        with self.condition:
+            checkouts = self.counters['checkouts']
+            return {
+                'pid': self.pid,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self.size,
+                'idle': len(self.idle),
+                'in_use': len(self.in_use),
+                'peak_in_use': self.peak_in_use,
+                'saturation': round(len(self.in_use) / self.max_size, 3),
+                **self.counters,
+                'wait_time_avg_ms': round(
+                    self.wait_time / checkouts * 1000 if checkouts else 0, 3
+                ),
+                'wait_time_max_ms': round(self.max_wait_time * 1000, 3),
+            }
@@ -0,0 +1,223 @@
+'''Per-request SQL statistics: query count, database time, repeated queries.
+
+QueryStatsMiddleware counts queries of every database connection (all
+aliases and threads, including the threads of api.asyncviews) through an
+execute wrapper installed on connections as they are opened. Queries are
+grouped by template (SQL with literals and IN lists collapsed), so the
+same query run for every object of a page (N+1) shows up as a template
+repeated more than SQL_REPEATED_QUERIES_LIMIT times.
+
+Every request is logged by the "foodgram.querystats" logger with the
+statistics as structured fields (WARNING for repeated queries or an
+exceeded budget, INFO otherwise) and, with SQL_SERVER_TIMING, reported by
+the Server-Timing header. Views declare their budget by the query_budget
+attribute (a number or a dict by action) or the query_budget decorator.
+With SQL_STRICT (tests, benchmark --strict-queries) such requests fail
+with QueryBudgetError. Queries of streaming responses made after the
+view has returned are not counted. The middleware is async capable, so
+under ASGI requests are not serialized on the thread of sync middleware.
+'''
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+current_stats = ContextVar('current_stats', default=None)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPACES = re.compile(r'\s+')
+LOG_FIELDS = (
+    'request_method', 'request_path', 'status_code', 'view', 'db_queries',
+    'db_time_ms', 'db_repeated', 'query_budget',
+)
+
+
+class QueryBudgetError(Exception):
+    '''View made more queries than declared or repeated a query (strict).'''
+
+
+def get_template(sql):
+    '''Return SQL with literals, placeholders and IN lists replaced.'''
+    sql = LITERALS.sub('?', SPACES.sub(' ', sql.strip()))
+    return PLACEHOLDER_LISTS.sub('(...)', sql)
+
+
+def query_budget(budget):
+    '''Declare query budget of a function view (put above @api_view).'''
+    def decorator(view):
+        view.query_budget = budget
+        return view
+
+    return decorator
+
+
+def get_query_budget(view_func, method):
+    '''Return budget declared by the view or its class for the method.'''
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is None:
+        view_class = getattr(view_func, 'cls', None) or getattr(
+            view_func, 'view_class', None
+        )
+        budget = getattr(view_class, 'query_budget', None)
+    if isinstance(budget, dict):
+        # Viewsets map methods to actions: {'get': 'list', ...}.
+        actions = getattr(view_func, 'actions', None) or {}
+        return budget.get(actions.get(method.lower(), method.lower()))
+    return budget
+
+
+class QueryStats:
+    '''Queries of one request.'''
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.templates = Counter()
+        self.view = None
+        self.budget = None
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.time += duration
+        self.templates[get_template(sql)] += 1
+
+    def get_repeated(self, limit):
+        '''Return [(template, count)] of templates run more than limit.'''
+        return [
+            (template, count)
+            for template, count in self.templates.most_common()
+            if count > limit
+        ]
+
+
+def record_query(execute, sql, params, many, context):
+    '''Execute wrapper adding the query to statistics of the request.'''
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record(sql, time.perf_counter() - start)
+
+
+def install_wrapper(sender=None, connection=None, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class JsonFormatter(logging.Formatter):
+    '''Format record as JSON with the statistics fields.'''
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(
+            (name, getattr(record, name))
+            for name in LOG_FIELDS
+            if hasattr(record, name)
+        )
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class QueryStatsMiddleware:
+    '''Collect, report and check SQL statistics of every request.'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        connection_created.connect(install_wrapper)
+        for connection in connections.all():
+            install_wrapper(connection=connection)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.report(request, response, stats)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        token = current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.report(request, response, stats)
+        return response
+
+    def report(self, request, response, stats):
+        # The view is resolved by the handler (no process_view: it would be
+        # run on the thread of sync middleware under ASGI).
+        match = request.resolver_match
+        if match is not None:
+            stats.view = getattr(match.func, '__name__', None)
+            stats.budget = get_query_budget(match.func, request.method)
+        repeated = stats.get_repeated(settings.SQL_REPEATED_QUERIES_LIMIT)
+        over_budget = stats.budget is not None and stats.count > stats.budget
+        time_ms = round(stats.time * 1000, 1)
+        if settings.SQL_SERVER_TIMING:
+            timing = f'db;dur={time_ms};desc="{stats.count} queries"'
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response['Server-Timing'] = timing
+        logger.log(
+            logging.WARNING if repeated or over_budget else logging.INFO,
+            '%s %s: %s queries, %s ms',
+            request.method, request.path, stats.count, time_ms,
+            extra={
+                'request_method': request.method,
+                'request_path': request.path,
+                'status_code': response.status_code,
+                'view': stats.view,
+                'db_queries': stats.count,
+                'db_time_ms': time_ms,
+                'db_repeated': [
+                    {'template': template, 'count': count}
+                    for template, count in repeated
+                ],
+                'query_budget': stats.budget,
+            }
+        )
+        if settings.SQL_STRICT and (repeated or over_budget):
+            problems = [
+                f'{count} times: {template}' for template, count in repeated
+            ]
+            if over_budget:
+                problems.insert(
+                    0, f'{stats.count} queries, budget {stats.budget}'
+                )
+            raise QueryBudgetError(
+                '{} {} ({}): {}'.format(
+                    request.method, request.path, stats.view,
+                    '; '.join(problems)
+                )
+            )
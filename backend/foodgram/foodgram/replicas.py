@@ -0,0 +1,142 @@
+'''Reads from replica databases with read-your-writes stickiness.
+
+ReplicaRouter sends reads to a random database of DATABASE_REPLICAS and
+writes to the primary (default). Reads go to the primary too:
+- during unsafe (POST, PATCH, DELETE...) requests, so a view reads what it
+  is writing (ReplicaMiddleware);
+- for REPLICA_STICKY_SECONDS after a successful unsafe request of the same
+  client (token or session), so the client sees its writes even if the
+  replicas lag behind;
+- inside transactions of the primary.
+The request state is a context variable, so it is seen by the threads of
+api.asyncviews as well. The middleware is async capable, so under ASGI
+requests are not serialized on the thread of sync middleware.
+'''
+import asyncio
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+STICKY_KEY = 'primary-reads:{digest}'
+
+use_primary = ContextVar('use_primary', default=False)
+
+
+def get_client_key(request):
+    '''Return cache key of the client making request, None if anonymous.'''
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return STICKY_KEY.format(
+        digest=hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+    )
+
+
+@contextmanager
+def primary_reads():
+    '''Read from the primary inside the block.
+
+    Used when filling caches keyed by a just bumped version, so a lagging
+    replica cannot cache stale data under the new version.
+    '''
+    token = use_primary.set(True)
+    try:
+        yield
+    finally:
+        use_primary.reset(token)
+
+
+def set_test_mirrors():
+    '''Point replicas at the test database they mirror (TEST MIRROR).
+
+    The test runner does it by itself; commands creating test databases
+    (benchmark, checkindexes) call it after create_test_db().
+    '''
+    for alias in settings.DATABASE_REPLICAS:
+        mirror = connections[alias].settings_dict['TEST'].get('MIRROR')
+        if mirror:
+            connections[alias].close()
+            connections[alias].creation.set_as_test_mirror(
+                connections[mirror].settings_dict
+            )
+
+
+class ReplicaRouter:
+    '''Database router: reads from replicas, writes to the primary.'''
+
+    def db_for_read(self, model, **hints):
+        if (
+            not settings.DATABASE_REPLICAS
+            or use_primary.get()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaMiddleware:
+    '''Pin reads of unsafe and following requests of the client to primary.'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Mark the instance as a coroutine function like MiddlewareMixin.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        client_key = get_client_key(request)
+        unsafe = request.method not in SAFE_METHODS
+        token = use_primary.set(
+            unsafe or client_key is not None and bool(cache.get(client_key))
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        if unsafe and client_key is not None and response.status_code < 400:
+            cache.set(client_key, True, settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    async def __acall__(self, request):
+        client_key = get_client_key(request)
+        unsafe = request.method not in SAFE_METHODS
+        # Cache backends (Redis) may block, keep them off the event loop.
+        sticky = client_key is not None and not unsafe and bool(
+            await sync_to_async(cache.get, thread_sensitive=False)(client_key)
+        )
+        token = use_primary.set(unsafe or sticky)
+        try:
+            response = await self.get_response(request)
+        finally:
+            use_primary.reset(token)
+        if unsafe and client_key is not None and response.status_code < 400:
+            await sync_to_async(cache.set, thread_sensitive=False)(
+                client_key, True, settings.REPLICA_STICKY_SECONDS
+            )
+        return response
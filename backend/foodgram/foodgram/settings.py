@@ -27,27 +27,43 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'foodgram.querystats.QueryStatsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'foodgram.replicas.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
 ROOT_URLCONF = 'foodgram.urls'
 
+# foodgram.dbpool: PostgreSQL with a connection pool in every process
+# (foodgram/dbpool). Connections are returned to the pool at the end of
+# request (CONN_MAX_AGE=0) and reused by the next one.
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv(
-            'DB_ENGINE', default='django.db.backends.postgresql'
-        ),
+        'ENGINE': os.getenv('DB_ENGINE', default='foodgram.dbpool'),
         'NAME': os.getenv('DB_NAME', default='postgres'),
         'USER': os.getenv('POSTGRES_USER', default='postgres'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='1234'),
         'HOST': os.getenv('DB_HOST', default='db'),
-        'PORT': os.getenv('DB_PORT', default=5432)
+        'PORT': os.getenv('DB_PORT', default=5432),
+        'CONN_MAX_AGE': int(os.getenv('CONN_MAX_AGE', default=0)),
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', default=1)),
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', default=20)),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', default=10)),
+            'MAX_LIFETIME': int(
+                os.getenv('DB_POOL_MAX_LIFETIME', default=60 * 60)
+            ),
+            'MAX_IDLE': int(os.getenv('DB_POOL_MAX_IDLE', default=5 * 60)),
+            'CHECK_INTERVAL': int(
+                os.getenv('DB_POOL_CHECK_INTERVAL', default=10)
+            ),
+        },
     }
 }
 
@@ -59,6 +75,71 @@ if DEBUG:
         }
     }
 
+# Read replicas of the default database (foodgram/replicas.py): comma
+# separated host or host:port of PostgreSQL replicas with the same name and
+# credentials. Replica connections are read-only, so a write routed to a
+# replica fails. With DEBUG, DB_READ_ONLY_REPLICA=True adds a read-only
+# connection to the SQLite file as a replica to test routing locally.
+DATABASE_REPLICAS = []
+if DEBUG:
+    if os.getenv('DB_READ_ONLY_REPLICA', default='False') == 'True':
+        DATABASES['replica1'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': 'file:{}?mode=ro'.format(DATABASES['default']['NAME']),
+            'OPTIONS': {'uri': True},
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append('replica1')
+else:
+    replica_hosts = [
+        address.strip()
+        for address in os.getenv('DB_REPLICA_HOSTS', default='').split(',')
+        if address.strip()
+    ]
+    for number, address in enumerate(replica_hosts, 1):
+        host, _, port = address.partition(':')
+        DATABASES[f'replica{number}'] = {
+            **DATABASES['default'],
+            'HOST': host,
+            'PORT': port or DATABASES['default']['PORT'],
+            'OPTIONS': {'options': '-c default_transaction_read_only=on'},
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(f'replica{number}')
+DATABASE_ROUTERS = ['foodgram.replicas.ReplicaRouter']
+# Reads of a client go to the primary for this long after its writes, sec.
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=5))
+
+# The cache must be shared by all processes: invalidation (new versions of
+# cached namespaces, users of tokens) made by one worker, a management
+# command or the admin has to be seen by every worker. Redis
+# (django_redis.cache.RedisCache with redis://host:port/db as
+# CACHE_LOCATION) by default, the file-based cache (a directory as
+# CACHE_LOCATION) with DEBUG. Per-process LocMemCache is safe only with a
+# single process and no management commands changing data.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default=(
+                'django.core.cache.backends.filebased.FileBasedCache'
+                if DEBUG else 'django_redis.cache.RedisCache'
+            )
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            default=(
+                os.path.join(BASE_DIR, 'cache') if DEBUG
+                else 'redis://redis:6379/0'
+            )
+        ),
+        'OPTIONS': {
+            # Culling of the file-based cache (ignored by other backends).
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
+    }
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -117,7 +198,7 @@ AUTH_USER_MODEL = 'users.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ),
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -138,6 +219,98 @@ EMAIL_MAX_LENGTH = 254
 USERNAME_MAX_LENGTH = 150
 NAMES_MAX_LENGTH = 250
 
+# Users authenticated by token are cached (users/authentication.py) in the
+# shared cache and in a small in-process LRU with short TTL (0 disables it).
+AUTH_CACHE_TIMEOUT = int(os.getenv('AUTH_CACHE_TIMEOUT', default=60 * 5))
+AUTH_LOCAL_CACHE_SIZE = int(os.getenv('AUTH_LOCAL_CACHE_SIZE', default=1024))
+AUTH_LOCAL_CACHE_TTL = int(os.getenv('AUTH_LOCAL_CACHE_TTL', default=5))
+
+# SQL statistics of requests (foodgram/querystats.py): a query template run
+# more than SQL_REPEATED_QUERIES_LIMIT times per request is reported as
+# repeated (N+1); SQL_STRICT fails such requests and requests over the
+# query budget of the view; SQL_SERVER_TIMING adds the Server-Timing header.
+SQL_STATS = os.getenv('SQL_STATS', default='True') == 'True'
+SQL_REPEATED_QUERIES_LIMIT = int(
+    os.getenv('SQL_REPEATED_QUERIES_LIMIT', default=3)
+)
+SQL_STRICT = os.getenv('SQL_STRICT', default='False') == 'True'
+SQL_SERVER_TIMING = os.getenv('SQL_SERVER_TIMING', default=str(DEBUG)) == 'True'
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'()': 'foodgram.querystats.JsonFormatter'},
+    },
+    'handlers': {
+        'querystats': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'loggers': {
+        'foodgram.querystats': {
+            'handlers': ['querystats'],
+            # INFO logs every request, WARNING - only problems.
+            'level': os.getenv('SQL_STATS_LOG_LEVEL', default='WARNING'),
+            'propagate': False,
+        },
+    },
+}
+
+# Upper bound of "limit" query parameter of paginated lists.
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', default=100))
+
+# Tag and ingredient catalogs: server cache timeout and client max-age.
+CATALOG_CACHE_TIMEOUT = int(
+    os.getenv('CATALOG_CACHE_TIMEOUT', default=60 * 60 * 24)
+)
+CATALOG_CACHE_MAX_AGE = int(os.getenv('CATALOG_CACHE_MAX_AGE', default=60))
+
+# Recipe pages for anonymous users are cached until recipes change.
+RECIPE_CACHE_TIMEOUT = int(
+    os.getenv('RECIPE_CACHE_TIMEOUT', default=60 * 60)
+)
+
+# Recipe images: uploads are fitted into IMAGE_MAX_SIZE px and re-encoded,
+# thumbnails (name: max side, px) are generated by IMAGE_WORKERS threads.
+IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', default='WEBP')
+IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', default=85))
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', default=1920))
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', default=40_000_000))
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', default=20 * 1024 * 1024)
+)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', default=2))
+THUMBNAIL_SIZES = {'small': 160, 'medium': 480}
+
+# Rendered shopping lists are cached until the cart or its recipes change.
+SHOPPING_LIST_CACHE_TIMEOUT = int(
+    os.getenv('SHOPPING_LIST_CACHE_TIMEOUT', default=60 * 60)
+)
+
+# Number of threads rendering shopping list export jobs in each process.
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', default=2))
+# Jobs pending or running longer are failed (interrupted by a restart),
+# jobs older than TTL are deleted with their files (api/jobs.py).
+EXPORT_JOB_TIMEOUT = int(os.getenv('EXPORT_JOB_TIMEOUT', default=10 * 60))
+EXPORT_JOB_TTL = int(os.getenv('EXPORT_JOB_TTL', default=24 * 60 * 60))
+
+# Read routes as async views running DRF views in a pool of threads per
+# process (api/asyncviews.py); foodgram/asgi.py turns it on.
+ASYNC_READ_VIEWS = os.getenv('ASYNC_READ_VIEWS', default='False') == 'True'
+ASYNC_READ_WORKERS = int(os.getenv('ASYNC_READ_WORKERS', default=16))
+
+# Autocomplete ingredients by the in-process index (api/search.py) instead of
+# LIKE queries to the database.
+INGREDIENT_SEARCH_INDEX = (
+    os.getenv('INGREDIENT_SEARCH_INDEX', default='True') == 'True'
+)
+# The index compares number and max id of ingredients with the database at
+# most this often, sec.
+INGREDIENT_INDEX_CHECK_INTERVAL = int(
+    os.getenv('INGREDIENT_INDEX_CHECK_INTERVAL', default=60)
+)
+
 CORS_ORIGIN_ALLOW_ALL = True
 
 CORS_URLS_REGEX = r'^/api/.*$'
@@ -0,0 +1,68 @@
+from django.test import TestCase, override_settings
+from django.urls import path
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+
+from .querystats import QueryBudgetError, get_template, query_budget
+from users.models import User
+
+
+@query_budget(1)
+@api_view(['GET'])
+@permission_classes((AllowAny, ))
+def over_budget(request):
+    return Response({
+        'users': User.objects.count(), 'staff': User.objects.filter(
+            is_staff=True
+        ).count()
+    })
+
+
+@api_view(['GET'])
+@permission_classes((AllowAny, ))
+def repeated_queries(request):
+    return Response([
+        User.objects.filter(pk=pk).exists() for pk in range(5)
+    ])
+
+
+urlpatterns = [
+    path('over-budget/', over_budget),
+    path('repeated-queries/', repeated_queries),
+]
+
+
+@override_settings(ROOT_URLCONF=__name__, SQL_SERVER_TIMING=True)
+class QueryStatsTest(TestCase):
+    '''QueryStatsMiddleware reporting and strict mode.'''
+
+    def test_template(self):
+        self.assertEqual(
+            get_template(
+                "SELECT  a FROM t WHERE id IN (%s, %s, %s) AND name = 'x'"
+            ),
+            'SELECT a FROM t WHERE id IN (...) AND name = ?'
+        )
+
+    def test_server_timing(self):
+        with self.assertLogs('foodgram.querystats', 'WARNING') as logs:
+            response = self.client.get('/over-budget/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+        self.assertEqual(logs.records[0].query_budget, 1)
+
+    @override_settings(SQL_STRICT=True)
+    def test_strict_budget(self):
+        with self.assertLogs('foodgram.querystats', 'WARNING'):
+            with self.assertRaisesMessage(
+                QueryBudgetError, '2 queries, budget 1'
+            ):
+                self.client.get('/over-budget/')
+
+    @override_settings(SQL_STRICT=True)
+    def test_strict_repeated_queries(self):
+        with self.assertLogs('foodgram.querystats', 'WARNING') as logs:
+            with self.assertRaisesMessage(QueryBudgetError, '5 times: SELECT'):
+                self.client.get('/repeated-queries/')
+        self.assertEqual(logs.records[0].db_repeated[0]['count'], 5)
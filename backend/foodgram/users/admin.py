@@ -12,7 +12,9 @@ class UserAdmin(admin.ModelAdmin):
         'role',
         'first_name',
         'last_name',
-        'is_blocked'
+        'is_blocked',
+        'recipes_count',
+        'followers_count',
     )
     search_fields = ('username', 'email', 'first_name', 'last_name')
     list_filter = ('role', 'username', 'email')
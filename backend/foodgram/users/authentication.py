@@ -0,0 +1,137 @@
+'''Token authentication with cached users.
+
+Snapshots of users (field values without the password hash) are cached by
+token in a bounded in-process LRU with short TTL and in the shared cache
+(CACHES), so an authenticated request usually makes no query before the
+view. Entries are invalidated by users.signals when the token is deleted
+(logout) or the user is saved (password or role change). Other processes
+drop their in-process entries when AUTH_LOCAL_CACHE_TTL expires.
+'''
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, router
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .models import User
+
+CACHE_KEY = 'auth-token:{digest}'
+# Not cached: user's password is loaded from the database when checked,
+# denormalized counters (updated by F() expressions) are loaded on access.
+# Deferred fields are not written back by save() of the snapshot user.
+SNAPSHOT_EXCLUDE = ('password', 'recipes_count', 'followers_count')
+
+
+class LocalCache:
+    '''Thread-safe LRU mapping of bounded size with TTL of entries.'''
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if self.size <= 0 or self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(
+    settings.AUTH_LOCAL_CACHE_SIZE, settings.AUTH_LOCAL_CACHE_TTL
+)
+
+
+def get_cache_key(token_key):
+    '''Return cache key of the token, the token itself is not stored.'''
+    return CACHE_KEY.format(
+        digest=hashlib.sha256(token_key.encode('utf-8')).hexdigest()
+    )
+
+
+def make_snapshot(user):
+    '''Return dict of field values of the user to cache.'''
+    return {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields
+        if field.attname not in SNAPSHOT_EXCLUDE
+    }
+
+
+def load_snapshot(snapshot):
+    '''Return user built from snapshot, not cached fields are deferred.
+
+    Deferred fields are loaded on access, save() writes loaded fields only.
+    '''
+    return User.from_db(
+        DEFAULT_DB_ALIAS, list(snapshot), list(snapshot.values())
+    )
+
+
+def invalidate_tokens(*token_keys):
+    '''Remove cached users of the tokens in this process and shared cache.'''
+    keys = [get_cache_key(token_key) for token_key in token_keys]
+    for key in keys:
+        local_cache.delete(key)
+    cache.delete_many(keys)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''TokenAuthentication reading users from in-process and shared caches.
+
+    request.auth is a Token built from the key, not loaded from database.
+    '''
+
+    def authenticate_credentials(self, key):
+        cache_key = get_cache_key(key)
+        snapshot = local_cache.get(cache_key)
+        if snapshot is None:
+            snapshot = cache.get(cache_key)
+            if snapshot is None:
+                try:
+                    # Primary: a token just created may be missing on replicas.
+                    token = Token.objects.using(
+                        router.db_for_write(Token)
+                    ).select_related('user').get(key=key)
+                except Token.DoesNotExist:
+                    raise exceptions.AuthenticationFailed(_('Invalid token.'))
+                snapshot = make_snapshot(token.user)
+                cache.set(cache_key, snapshot, settings.AUTH_CACHE_TIMEOUT)
+            local_cache.set(cache_key, snapshot)
+        user = load_snapshot(snapshot)
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return (user, Token(key=key, user=user))
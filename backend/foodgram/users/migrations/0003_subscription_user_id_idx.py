@@ -0,0 +1,17 @@
+# Generated by Django 3.2.16 on 2026-10-18 03:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-id'], name='subscription_user_id_idx'),
+        ),
+    ]
@@ -49,6 +49,17 @@ class User(AbstractUser):
         verbose_name='Фамилия',
         max_length=CHARFIELD_MAX_LENGTH,
     )
+    # Denormalized counters, maintained by api.signals and users.signals.
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков'
+    )
     # To authenticate with email instead of username reassign USERNAME_FIELD.
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -58,6 +69,13 @@ class User(AbstractUser):
         verbose_name_plural = 'Пользователи'
         ordering = ('username',)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Saved values, to find the changed fields on save (api.signals).
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     @property
     def is_admin(self):
         return self.role == Roles.admin.value
@@ -92,6 +110,12 @@ class Subscription(models.Model):
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
         ordering = ('following',)
+        indexes = [
+            # Cursor pagination of user's subscriptions.
+            models.Index(
+                fields=['user', '-id'], name='subscription_user_id_idx'
+            ),
+        ]
         constraints = [
             models.UniqueConstraint(
                 name="user_follow_unique_relationships",
@@ -26,13 +26,16 @@ class UserSerializer(serializers.ModelSerializer):
 
     def get_is_subscribed(self, obj):
         # Return True if requesting user is subscribed to the author.
+        # Querysets planned by the views provide it as an annotation.
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if (
             'request' in self.context  # Need to add this for "users/me/" url.
             and self.context['request'].user.is_authenticated
         ):
-            return obj in User.objects.filter(
-                following__user=self.context['request'].user
-            )
+            return obj.following.filter(
+                user=self.context['request'].user
+            ).exists()
         return False
 
 
@@ -0,0 +1,51 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_tokens
+from .models import Subscription, User
+
+
+@receiver(post_save, sender=Subscription)
+def increment_followers_count(sender, instance, created, **kwargs):
+    '''Increment followers counter of the author on new subscription.'''
+    if created and instance.following_id:
+        User.objects.filter(pk=instance.following_id).update(
+            followers_count=F('followers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Subscription)
+def decrement_followers_count(sender, instance, **kwargs):
+    '''Decrement followers counter of the author on unsubscription.'''
+    if instance.following_id:
+        User.objects.filter(pk=instance.following_id).update(
+            followers_count=Greatest(F('followers_count') - 1, 0)
+        )
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    '''Forget cached user of the deleted token (logout).'''
+    invalidate_tokens(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, update_fields=None, **kwargs):
+    '''Forget cached user of tokens of the saved user.
+
+    Password, role or activity may be changed. Saving last_login only
+    (on every login) changes nothing cached.
+    '''
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    token_keys = list(
+        Token.objects.filter(user=instance).values_list('key', flat=True)
+    )
+    if token_keys:
+        invalidate_tokens(*token_keys)
+        # Again after commit: a concurrent request may cache the old user.
+        transaction.on_commit(lambda: invalidate_tokens(*token_keys))
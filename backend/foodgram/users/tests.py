@@ -0,0 +1,81 @@
+from django.core.cache import cache
+from django.test import override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from .authentication import get_cache_key, local_cache
+from .models import User
+from api.benchmarks import ISOLATED_CACHES, clear_caches
+
+PASSWORD = 'foodgram-password'
+
+
+@override_settings(CACHES=ISOLATED_CACHES)
+class CachedTokenAuthenticationTest(APITestCase):
+    '''Cached users of tokens are evicted on logout and on user changes.
+
+    Both the in-process LRU and the shared cache are checked: the next
+    request authenticates the changed user or fails.
+    '''
+
+    def setUp(self):
+        clear_caches()
+        self.user = User.objects.create_user(
+            username='user', email='user@foodgram.ru', password=PASSWORD,
+            first_name='First', last_name='Last'
+        )
+        token = Token.objects.create(user=self.user)
+        self.cache_key = get_cache_key(token.key)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(self.get_me().status_code, 200)
+        self.assert_cached(True)
+
+    def get_me(self):
+        return self.client.get('/api/users/me/')
+
+    def assert_cached(self, cached):
+        for name, layer in (('local', local_cache), ('shared', cache)):
+            with self.subTest(cache=name):
+                self.assertEqual(layer.get(self.cache_key) is not None, cached)
+
+    def change_user(self, **fields):
+        '''Save the user with changed fields (e.g. by admin).'''
+        user = User.objects.get(pk=self.user.pk)
+        for name, value in fields.items():
+            setattr(user, name, value)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+
+    def test_logout(self):
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assert_cached(False)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_set_password(self):
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': PASSWORD, 'new_password': 'new-password-1q2w'
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assert_cached(False)
+        self.assertEqual(self.get_me().status_code, 200)
+        self.assertTrue(
+            User.objects.get(pk=self.user.pk).check_password(
+                'new-password-1q2w'
+            )
+        )
+
+    def test_inactive(self):
+        self.change_user(is_active=False)
+        self.assert_cached(False)
+        self.assertEqual(self.get_me().status_code, 401)
+
+    def test_staff(self):
+        self.assertEqual(
+            self.client.get('/api/metrics/db_pool/').status_code, 403
+        )
+        self.change_user(is_staff=True)
+        self.assert_cached(False)
+        self.assertEqual(
+            self.client.get('/api/metrics/db_pool/').status_code, 200
+        )
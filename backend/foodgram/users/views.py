@@ -1,11 +1,11 @@
-from django.shortcuts import get_object_or_404
+from django.db.models import Exists, OuterRef
 from rest_framework import filters, mixins, permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 
-from .models import User
+from .models import Subscription, User
 from .serializers import (NewUserCreateSerializer, UserResetPasswordSerializer,
                           UserSerializer)
 
@@ -18,6 +18,21 @@ class UserViewSet(viewsets.ModelViewSet):
     search_fields = ('username',)
     pagination_class = LimitOffsetPagination
     permission_classes = (AllowAny,)
+    # Queries per request (foodgram/querystats.py).
+    query_budget = {'list': 3, 'retrieve': 2, 'me': 1, 'create': 5}
+
+    def get_queryset(self):
+        '''Annotate users with is_subscribed of the request user.'''
+        user = self.request.user
+        if not user.is_authenticated:
+            return super().get_queryset()
+        return super().get_queryset().annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(
+                    user=user, following=OuterRef('pk')
+                )
+            )
+        )
 
     def get_serializer_class(self):
         if (
@@ -40,7 +55,8 @@ class UserViewSet(viewsets.ModelViewSet):
         permission_classes=(permissions.IsAuthenticated,)
     )
     def me(self, request):
-        user = get_object_or_404(User, username=request.user.username)
+        # Authentication has already loaded the user (maybe from cache).
+        user = request.user
         if request.method == 'GET':
             return Response(
                 UserSerializer(user).data,
@@ -64,6 +80,7 @@ class UserResetPasswordViewSet(
     '''Custom ViewSet for resetting password. Only POST available.'''
     permission_classes = (permissions.IsAuthenticated,)
     serializer_class = UserResetPasswordSerializer
+    query_budget = 5
 
     def perform_create(self, serializer):
         user = self.request.user
@@ -71,7 +88,7 @@ class UserResetPasswordViewSet(
         current_password = serializer.data.get('current_password')
         if user.check_password(current_password):
             user.set_password(serializer.validated_data.get('new_password'))
-            user.save()
+            user.save(update_fields=['password'])
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({'Current_password': ['Wrong password.']},
                         status=status.HTTP_400_BAD_REQUEST)